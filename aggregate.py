@@ -0,0 +1,165 @@
+""" this module groups pods by identical output of each step and diffs outliers against majority,
+    output is streamed through hash, only one capped sample is kept per distinct output """
+
+import difflib
+import gzip
+import hashlib
+import re
+import threading
+
+READ_CHUNK = 65536
+# longer line, like in binary output, is cut into pieces of this size
+MAX_LINE_BYTES = 1024 * 1024
+# terminal control sequences in pane output, csi, osc and charset / keypad switches
+ESCAPES = re.compile(r'\x1b(\[[0-9;?]*[ -/]*[@-~]|\][^\x07\x1b]*(\x07|\x1b\\)'
+                     r'|[()][0-9A-Za-z]|[=>])')
+POD_MASK = '{pod}'
+# lines of sample kept per distinct output, diff of longer outputs covers only their start
+SAMPLE_LINES = 5000
+DIFF_LINES = 40
+PODS_SHOWN = 10
+REPORT_NAME = 'aggregate.txt'
+
+
+def normalize(line, names):
+    """ line without terminal sequences, carriage returns and trailing blanks,
+        pod names masked, so pods differing only in their own name are identical """
+    line = ESCAPES.sub('', line).replace('\r', '').rstrip()
+    for name in names:
+        line = line.replace(name, POD_MASK)
+    return line
+
+
+def iter_lines(chunks):
+    """ text lines of stream of byte chunks, line split between chunks is joined """
+    rest = b''
+    for chunk in chunks:
+        lines = (rest + chunk).split(b'\n')
+        rest = lines.pop()
+        if len(rest) > MAX_LINE_BYTES:
+            lines.append(rest)
+            rest = b''
+        for line in lines:
+            yield line.decode('utf-8', errors='backslashreplace')
+    if rest:
+        yield rest.decode('utf-8', errors='backslashreplace')
+
+
+def pane_output(lines, exit_tag):
+    """ output of step from its pane log, without typed command line, echoed exit code
+        and prompt that follows it, so only what command printed is compared """
+    prompt = False
+    for line in lines:
+        clean = ESCAPES.sub('', line).replace('\r', '').rstrip()
+        # typed command ends with exit code echo, prompt of retry is on same line
+        if f"{exit_tag}=$" in clean:
+            prompt = False
+            continue
+        if prompt:
+            continue
+        output, tag, code = clean.rpartition(f"{exit_tag}=")
+        if tag and code.isdigit():
+            # output without trailing new line is followed by exit code on same line
+            if output:
+                yield output
+            prompt = True
+            continue
+        yield line
+
+
+def file_chunks(path):
+    """ chunks of file, gzipped one is decompressed on the fly """
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rb') as f:
+        while True:
+            chunk = f.read(READ_CHUNK)
+            if not chunk:
+                return
+            yield chunk
+
+
+class OutputGroup:
+    """ pods with same output of one step """
+
+    def __init__(self, sample, lines, binary):
+        self.sample = sample
+        self.lines = lines
+        self.binary = binary
+        self.pods = []
+
+
+class Aggregator:
+    """ per step groups of pods by hash of their normalized output, fed from worker threads """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # step -> (label, digest -> group)
+        self.steps = {}
+
+    def add(self, pod, step, label, lines):
+        """ hash output lines of step on pod, keep sample if output was not seen before """
+        digest = hashlib.sha256()
+        names = sorted({pod.name, str(pod)}, key=len, reverse=True)
+        sample = []
+        count = 0
+        binary = False
+        for line in lines:
+            line = normalize(line, names)
+            digest.update(line.encode('utf-8', errors='backslashreplace') + b'\n')
+            binary = binary or '\0' in line
+            # binary output is not diffed, so its sample is not kept
+            if count < SAMPLE_LINES and not binary:
+                sample.append(line)
+            count += 1
+        with self.lock:
+            groups = self.steps.setdefault(step, (label, {}))[1]
+            group = groups.get(digest.hexdigest())
+            if group is None:
+                group = groups[digest.hexdigest()] = OutputGroup(
+                    [] if binary else sample, count, binary)
+            group.pods.append(pod)
+
+    def add_file(self, pod, step, label, path):
+        """ hash output of step on pod from file, missing file is output of its own """
+        try:
+            self.add(pod, step, label, iter_lines(file_chunks(path)))
+        except (OSError, EOFError) as e:
+            self.add(pod, step, label, [f"can't read {path}: {e}"])
+
+    def step_lines(self, step):
+        """ majority and outliers of one step, with diff of each outlier group """
+        label, groups = self.steps[step]
+        ranked = sorted(groups.values(), key=lambda group: -len(group.pods))
+        majority = ranked[0]
+        outliers = sum(len(group.pods) for group in ranked[1:])
+        lines = [f"step {step} {label}: {len(majority.pods)} pods identical, " +
+                 f"{outliers} outliers in {len(ranked) - 1} groups"]
+        for group in ranked[1:]:
+            pods = sorted(str(pod) for pod in group.pods)
+            more = f" and {len(pods) - PODS_SHOWN} more" if len(pods) > PODS_SHOWN else ''
+            lines.append(f"  {len(pods)} pods, {group.lines} lines: " +
+                         ' '.join(pods[:PODS_SHOWN]) + more)
+            if group.binary or majority.binary:
+                lines.append("    binary output differs")
+                continue
+            diff = list(difflib.unified_diff(majority.sample, group.sample, 'majority',
+                                             pods[0], n=1, lineterm=''))
+            for line in diff[:DIFF_LINES]:
+                lines.append(f"    {line}")
+            if len(diff) > DIFF_LINES:
+                lines.append(f"    ... {len(diff) - DIFF_LINES} more diff lines")
+        return lines
+
+    def lines(self):
+        """ report of all steps, in step order """
+        lines = []
+        for step in sorted(self.steps):
+            lines += self.step_lines(step)
+        return lines or ["no step output to compare"]
+
+    def write(self, path):
+        """ write report to file, returns its lines """
+        lines = self.lines()
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+        return lines
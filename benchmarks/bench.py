@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+""" end to end benchmark of tmux_k8s, runs real tmux_k8s.py against fake api server,
+    kubectl shim with fixed latency and private tmux server whose starts are counted """
+
+import glob
+import json
+import os
+import re
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import fake_k8s
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+TMUX_K8S = os.path.join(os.path.dirname(BENCH_DIR), 'tmux_k8s.py')
+NAMESPACE = 'bench'
+# --name=value options and their defaults
+OPTIONS = {
+    'pods': '10,100,1000',
+    'sequences': 'dry,env,xs',
+    'latency': '0.05',
+    'timeout': '900',
+    'json': '',
+}
+# first line printed once pods are listed, tmux_k8s is started up by then
+STARTED_MARKS = ('==== new session', '--- headless')
+# attach fails without terminal, so such run ends with exit 1 once sequence is done
+ATTACH_MARK = '--- attaching tmux'
+# -X importtime line, "import time: self [us] | cumulative | module", on stderr of run
+IMPORT_MARK = 'import time:'
+# headless run prints failed pods, tmux run writes outcome of each step into report.json,
+# steps that do not wait for prompt have no outcome, missing kubectl calls count for them
+HEADLESS_DONE = re.compile(r'--- headless done in .*, (\d+) failed')
+FAILED_OUTCOMES = ('failed', 'unfinished')
+# timings of run with failed steps measure failure, not sequence, they are not reported
+TIMINGS = ('startup', 'wall', 'cpu', 'tmux cpu')
+# pane shells are not login shells, whose /etc/profile would drop kubectl shim from PATH
+TMUX_CONF = 'set -g default-command /bin/sh\n'
+OUTPUT_TAIL_LINES = 5
+# result columns, (name, width), float values have two decimals
+COLUMNS = (('sequence', 10), ('pods', 6), ('exit', 5), ('failed', 6), ('list', 6), ('import', 6),
+           ('startup', 8), ('wall', 8), ('cpu', 7), ('tmux procs', 10), ('tmux cpu', 8),
+           ('api calls', 9))
+
+
+def parse_options(args):
+    """ --name=value options over defaults, exits on unknown one """
+    options = dict(OPTIONS)
+    for arg in args:
+        name, _, value = arg[2:].partition('=')
+        if not arg.startswith('--') or name not in options:
+            print(f"unknown option {arg}, options: " +
+                  ' '.join(f"--{name}={value}" for name, value in OPTIONS.items()))
+            sys.exit(2)
+        options[name] = value
+    return options
+
+
+def tmux_server_cpu(tmux, env):
+    """ user + system seconds used so far by tmux server, None if there is no server """
+    pid = subprocess.run([tmux, 'display-message', '-p', '#{pid}'], env=env, check=False,
+                         stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True).stdout
+    if not pid.strip():
+        return None
+    try:
+        with open(f'/proc/{pid.strip()}/stat', encoding='utf-8') as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+    except OSError:
+        return None
+    # utime and stime are 14th and 15th field, counted from pid
+    return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+
+
+def bench_env(work, port, tmux, latency):
+    """ environment of tmux_k8s run, everything it touches lives in work directory """
+    kubeconfig = os.path.join(work, 'kubeconfig')
+    with open(kubeconfig, 'w', encoding='utf-8') as f:
+        f.write(fake_k8s.kubeconfig(port))
+    tmux_conf = os.path.join(work, 'tmux.conf')
+    with open(tmux_conf, 'w', encoding='utf-8') as f:
+        f.write(TMUX_CONF)
+    env = dict(os.environ)
+    # tmux_k8s must not end up in session benchmark was started from
+    env.pop('TMUX', None)
+    env.update({
+        'KUBECONFIG': kubeconfig,
+        'PATH': BENCH_DIR + os.pathsep + env.get('PATH', ''),
+        # plain shell, prompt is ready as soon as window is, whatever user's rc files do
+        'SHELL': '/bin/sh',
+        'TMUX_TMPDIR': work,
+        'TMUX_K8S_CACHE_DIR': os.path.join(work, 'cache'),
+        'TMUX_K8S_OUTPUT_DIR': work,
+        'TMUX_K8S_BENCH_TMUX': tmux,
+        'TMUX_K8S_BENCH_TMUX_LOG': os.path.join(work, 'tmux.log'),
+        'TMUX_K8S_BENCH_TMUX_CONF': tmux_conf,
+        'TMUX_K8S_BENCH_KUBECTL_LOG': os.path.join(work, 'kubectl.log'),
+        'TMUX_K8S_BENCH_LATENCY': latency,
+    })
+    return env
+
+
+def list_time(env, work):
+    """ seconds tmux_k8s takes to list sequences, cli startup without tmux and kubernetes """
+    start = time.monotonic()
+    subprocess.run([sys.executable, TMUX_K8S, 'list'], cwd=work, env=env, check=False,
+                   stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return time.monotonic() - start
+
+
+def kubectl_steps(env, work, sequence):
+    """ number of sequence steps that call kubectl, each pod calls shim at least that often """
+    info = subprocess.run([sys.executable, TMUX_K8S, 'info', sequence], cwd=work, env=env,
+                          check=False, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                          stderr=subprocess.DEVNULL, text=True).stdout
+    return sum(line.startswith('kubectl ') for line in info.splitlines())
+
+
+def count_lines(path):
+    """ lines of call log, 0 if nothing was called """
+    try:
+        with open(path, encoding='utf-8') as f:
+            return len(f.readlines())
+    except FileNotFoundError:
+        return 0
+
+
+def failed_steps(work):
+    """ steps that failed or never finished, from run report of tmux run """
+    failed = 0
+    for path in glob.glob(os.path.join(work, '*', 'report.json')):
+        with open(path, encoding='utf-8') as f:
+            failed += sum(step['outcome'] in FAILED_OUTCOMES for step in json.load(f)['steps'])
+    return failed
+
+
+def run_once(sequence, pods, options, tmux):
+    """ run sequence on pods once, returns measured values """
+    with tempfile.TemporaryDirectory(prefix='tmux_k8s_bench-') as work:
+        server = fake_k8s.serve(pods)
+        env = bench_env(work, server.server_port, tmux, options['latency'])
+        result = {'sequence': sequence, 'pods': pods, 'list': list_time(env, work), 'import': 0.0}
+        expected_calls = pods * kubectl_steps(env, work, sequence)
+        tail = []
+        attached = False
+        before = resource.getrusage(resource.RUSAGE_CHILDREN)
+        start = time.monotonic()
+        with subprocess.Popen([sys.executable, '-X', 'importtime', TMUX_K8S, sequence, 'bench',
+                               NAMESPACE],
+                              cwd=work, env=env, stdin=subprocess.DEVNULL,
+                              stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True,
+                              errors='backslashreplace') as proc:
+            timer = threading.Timer(float(options['timeout']), proc.kill)
+            timer.start()
+            try:
+                for line in proc.stdout:
+                    if line.startswith(IMPORT_MARK):
+                        # self times of all modules add up to time spent importing
+                        self_us = line[len(IMPORT_MARK):].split('|')[0].strip()
+                        if self_us.isdigit():
+                            result['import'] += int(self_us) / 1e6
+                        continue
+                    done = HEADLESS_DONE.match(line)
+                    if done:
+                        result['failed'] = int(done.group(1))
+                    if 'startup' not in result and line.startswith(STARTED_MARKS):
+                        result['startup'] = time.monotonic() - start
+                    attached = attached or line.startswith(ATTACH_MARK)
+                    tail = (tail + [line.rstrip()])[-OUTPUT_TAIL_LINES:]
+                result['exit'] = proc.wait()
+            finally:
+                timer.cancel()
+        result['wall'] = time.monotonic() - start
+        after = resource.getrusage(resource.RUSAGE_CHILDREN)
+        result['cpu'] = (after.ru_utime - before.ru_utime) + (after.ru_stime - before.ru_stime)
+        result['tmux cpu'] = tmux_server_cpu(tmux, env)
+        subprocess.run([tmux, 'kill-server'], env=env, check=False,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        server.shutdown()
+        result['tmux procs'] = count_lines(env['TMUX_K8S_BENCH_TMUX_LOG'])
+        result['api calls'] = server.requests
+        if 'failed' not in result:
+            result['failed'] = failed_steps(work)
+        missing = expected_calls - count_lines(env['TMUX_K8S_BENCH_KUBECTL_LOG'])
+        result['failed'] = max(result['failed'], missing)
+        if result['failed']:
+            for name in TIMINGS:
+                result[name] = None
+        if result['failed'] or result['exit'] != 0 and not attached:
+            result['output'] = tail
+    return result
+
+
+def format_row(values):
+    """ table row of values, sequence name left aligned, missing values as - """
+    cells = []
+    for name, width in COLUMNS:
+        value = values.get(name)
+        if value is None:
+            value = '-'
+        elif isinstance(value, float):
+            value = f"{value:.2f}"
+        cells.append(f"{value:<{width}}" if name == 'sequence' else f"{value:>{width}}")
+    return ' '.join(cells)
+
+
+def main():
+    """ run every sequence on every pod count, print table, optionally write json """
+    options = parse_options(sys.argv[1:])
+    tmux = shutil.which('tmux', path=os.environ.get('PATH', '').replace(BENCH_DIR, ''))
+    if tmux is None:
+        print("tmux not found")
+        sys.exit(1)
+    print(format_row({name: name for name, _ in COLUMNS}))
+    results = []
+    for pods in [int(count) for count in options['pods'].split(',')]:
+        for sequence in options['sequences'].split(','):
+            result = run_once(sequence, pods, options, tmux)
+            results.append(result)
+            print(format_row(result), flush=True)
+            for line in result.get('output', []):
+                print(f"    {line}")
+    if options['json']:
+        with open(options['json'], 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=1)
+    if any(result['failed'] for result in results):
+        print("some runs had failed steps, their timings are left out")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+""" fake kubernetes api server for benchmarks, namespaces and N running pods in each of them """
+
+import json
+import sys
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+NAMESPACES = ('default', 'bench')
+RESOURCE_VERSION = '1000'
+# watch without events ends after this long, instead of its full timeout
+WATCH_SECONDS = 1
+
+
+class FakeK8sHandler(BaseHTTPRequestHandler):
+    """ answers namespace list, paginated pod list and empty pod watch """
+
+    def log_message(self, *_):
+        """ keep benchmark output clean """
+
+    def send_json(self, body):
+        """ reply with json body, None is empty reply """
+        data = b'' if body is None else json.dumps(body).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """ route request by path """
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        parts = url.path.strip('/').split('/')
+        time.sleep(self.server.delay)
+        self.server.requests += 1
+        if url.path == '/api/v1/namespaces':
+            self.send_json({'kind': 'NamespaceList', 'apiVersion': 'v1',
+                            'metadata': {'resourceVersion': RESOURCE_VERSION},
+                            'items': [{'metadata': {'name': name}} for name in NAMESPACES]})
+        elif len(parts) == 5 and parts[4] == 'pods' and query.get('watch') == ['true']:
+            time.sleep(min(float(query.get('timeoutSeconds', ['0'])[0]), WATCH_SECONDS))
+            # watch events would be one json object per line, there are none
+            self.send_json(None)
+        elif len(parts) == 5 and parts[4] == 'pods':
+            self.send_json(self.pod_list(parts[3], query))
+        else:
+            self.send_response(404)
+            self.end_headers()
+
+    def pod_list(self, namespace, query):
+        """ one page of pods of namespace, continue token is index of next pod """
+        start = int(query.get('continue', ['0'])[0])
+        limit = int(query.get('limit', ['0'])[0]) or self.server.pods
+        end = min(start + limit, self.server.pods)
+        metadata = {'resourceVersion': RESOURCE_VERSION}
+        if end < self.server.pods:
+            metadata['continue'] = str(end)
+        items = [{'metadata': {'name': f'pod-{index:05d}', 'namespace': namespace,
+                               'resourceVersion': RESOURCE_VERSION}}
+                 for index in range(start, end)]
+        return {'kind': 'PodList', 'apiVersion': 'v1', 'metadata': metadata, 'items': items}
+
+
+def serve(pods, delay=0.0, port=0):
+    """ start server in background thread, returns it, its port is server.server_port """
+    server = ThreadingHTTPServer(('127.0.0.1', port), FakeK8sHandler)
+    server.daemon_threads = True
+    server.pods = pods
+    server.delay = delay
+    server.requests = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def kubeconfig(port):
+    """ kube config with single bench context pointing to fake server """
+    return '\n'.join([
+        'apiVersion: v1',
+        'kind: Config',
+        'clusters:',
+        f'- {{name: bench, cluster: {{server: "http://127.0.0.1:{port}"}}}}',
+        'users:',
+        '- {name: bench, user: {token: bench}}',
+        'contexts:',
+        '- {name: bench, context: {cluster: bench, user: bench}}',
+        'current-context: bench',
+        ''])
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print(f"usage: {sys.argv[0]} pods [port] [delay seconds]")
+        sys.exit(2)
+    fake = serve(int(sys.argv[1]), float(sys.argv[3]) if len(sys.argv) > 3 else 0.0,
+                 int(sys.argv[2]) if len(sys.argv) > 2 else 0)
+    print(kubeconfig(fake.server_port))
+    threading.Event().wait()
@@ -0,0 +1,112 @@
+""" this module streams output of collecting steps into per run directory, compressed on the fly,
+    and post processes each artifact on local process pool as soon as it lands """
+
+import gzip
+import importlib
+import os
+import shlex
+import shutil
+import subprocess
+import tempfile
+import time
+# process pool, and multiprocessing with it, is loaded only once collector is created
+import concurrent.futures
+
+from seq_constants import POST_PROCESS_PYTHON
+
+OUTPUT_DIR = os.environ.get('TMUX_K8S_OUTPUT_DIR', '.')
+POST_PROCESS_WORKERS = os.cpu_count() or 4
+READ_CHUNK = 65536
+ARTIFACT_SUFFIX = '.gz'
+POST_PROCESS_SUFFIX = '.out'
+
+
+def stream_to_file(command, path, shell):
+    """ run command, its stdout goes gzipped to path as it comes,
+        returns exit code and stderr of command """
+    with tempfile.TemporaryFile() as errors, gzip.open(path, 'wb') as artifact:
+        with subprocess.Popen(command, shell=True, executable=shell, stdin=subprocess.DEVNULL,
+                              stdout=subprocess.PIPE, stderr=errors) as proc:
+            shutil.copyfileobj(proc.stdout, artifact, READ_CHUNK)
+        errors.seek(0)
+        return proc.returncode, errors.read().decode('utf-8', errors='backslashreplace')
+
+
+def post_process(command, artifact, output):
+    """ worker, feed decompressed artifact to local command, or to python:module.function
+        called right here, its output goes to output file, returns (output, exit code, seconds) """
+    start = time.monotonic()
+    if command.strip().startswith(POST_PROCESS_PYTHON):
+        module, _, function = command.strip()[len(POST_PROCESS_PYTHON):].rpartition('.')
+        with gzip.open(artifact, 'rb') as source:
+            text = getattr(importlib.import_module(module), function)(source.read())
+        with open(output, 'w', encoding='utf-8') as target:
+            target.write(text)
+        return output, 0, time.monotonic() - start
+    with gzip.open(artifact, 'rb') as source, open(output, 'wb') as target:
+        with subprocess.Popen(command, shell=True, stdin=subprocess.PIPE, stdout=target) as proc:
+            try:
+                shutil.copyfileobj(source, proc.stdin, READ_CHUNK)
+            except BrokenPipeError:
+                pass
+            proc.stdin.close()
+    return output, proc.returncode, time.monotonic() - start
+
+
+class Collector:
+    """ artifacts of one run in their own directory, post processed on pool of local processes """
+
+    def __init__(self, run_dir):
+        self.run_dir = run_dir
+        os.makedirs(self.run_dir, exist_ok=True)
+        # worker processes are started on first submit
+        self.pool = concurrent.futures.ProcessPoolExecutor(max_workers=POST_PROCESS_WORKERS)
+        self.futures = []
+        self.failed = 0
+
+    def path(self, pod, step):
+        """ artifact file of collecting step on pod """
+        return os.path.join(self.run_dir,
+                            f"{str(pod).replace('/', '_')}.{step.collect}{ARTIFACT_SUFFIX}")
+
+    def output_path(self, pod, step):
+        """ post processed output of collecting step on pod, or its artifact if it has none """
+        artifact = self.path(pod, step)
+        if not step.post_process:
+            return artifact
+        return artifact[:-len(ARTIFACT_SUFFIX)] + POST_PROCESS_SUFFIX
+
+    def shell_keys(self, pod, step, command, shell='sh'):
+        """ command line typed into pod shell, stdout of command is gzipped into artifact,
+            stderr stays on terminal, fish groups commands with begin; end """
+        group = "begin; {}; end" if os.path.basename(shell) == 'fish' else "{{ {}; }}"
+        return f"{group.format(command)} | gzip -c > {shlex.quote(self.path(pod, step))}"
+
+    def landed(self, pod, step):
+        """ collecting step on pod is done, post process its artifact in background """
+        if not step.post_process:
+            return
+        output = self.output_path(pod, step)
+        future = self.pool.submit(post_process, step.post_process, self.path(pod, step), output)
+        future.add_done_callback(lambda done: self._processed(pod, done))
+        self.futures.append(future)
+
+    def _processed(self, pod, future):
+        """ print outcome of post processing """
+        try:
+            output, returncode, seconds = future.result()
+        except (OSError, ImportError, AttributeError, ValueError) as e:
+            print(f"{pod} -> post process failed: {e}")
+            self.failed += 1
+            return
+        if returncode != 0:
+            self.failed += 1
+        print(f"{pod} -> post processed into {os.path.basename(output)}, " +
+              f"exit {returncode}, {seconds:.2f}s")
+
+    def close(self):
+        """ wait for post processing still running, print where artifacts are """
+        self.pool.shutdown(wait=True)
+        if self.futures:
+            print(f"--- post processed {len(self.futures)} artifacts, {self.failed} failed")
+        print(f"--- artifacts in {self.run_dir}")
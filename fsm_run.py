@@ -0,0 +1,730 @@
+""" this module runs compiled sequence on listed pods, each pod in tmux pane driven by
+    finite state machine, or headless, imported by tmux_k8s only once cli args are checked """
+
+import itertools
+import shlex
+import time
+import sys
+import os
+import signal
+import libtmux
+from libtmux._internal.query_list import ObjectDoesNotExist
+
+
+from pod2container import pod2container as p2c
+from pod2container import pod2container_log as p2cLog
+
+from collect import Collector, OUTPUT_DIR
+from fsm_scheduler import Scheduler, Admission
+from pod_discovery import discover_pod_pages, LISTED_VERSIONS, LISTED_LABELS
+from pod_membership import PodMembership
+from run_report import RunReport, OUTCOME_OK, OUTCOME_NO_WAIT, OUTCOME_GONE
+from run_report import OUTCOME_FAILED, OUTCOME_RETRY
+from headless import execute_headless, HEADLESS_WORKERS
+from pane_index import PaneGone
+from pane_layout import PaneLayout, LayoutError
+from pane_watch import PaneWatcher, EXIT_TAG, exit_echo
+from pane_log import PaneLog, load_index, iter_step
+from aggregate import Aggregator, iter_lines, pane_output, REPORT_NAME
+from tmux_control import TmuxControl, ControlModeError
+from seq_template import STEP_EXEC, STEP_COMMENT, STEP_REFRESH, STEP_SLEEP
+from seq_template import STEP_ATTACH, STEP_TERMINATE, STEP_FINAL_EXEC
+from seq_template import WAVE_BATCH
+
+SLEEP_TIME = 330
+PROMPT_STABLE_SECONDS = 0.1
+PROMPT_READY_TIMEOUT = 30
+STEP_COMPLETE = -1
+BASE_WINDOW_NAME = 'base'
+
+
+def signal_handler_detach(sig, _):
+    """ set signal handler for ctr+c """
+    print(f'You pressed Ctrl+C! {sig}, exiting, leaving tmux windows')
+    sys.exit(9)
+
+
+def get_fsm_prompt(pods_list, panes):
+    """ tmux on start will get base prompt for given shell, catch that one,
+        pane is ready once its last line is same on two captures in a row """
+    print("---- waiting for prompt to stabilize")
+    fsm_prompt = {}
+    last_line = {}
+    waiting = pods_list
+    deadline = time.monotonic() + PROMPT_READY_TIMEOUT
+    while waiting:
+        captured = panes.capture_many(waiting)
+        for pod in waiting:
+            lines = captured.get(pod)
+            line = lines[-1] if lines else ''
+            if line and last_line.get(pod) == line:
+                print(f"prompt {pod} ->" + line)
+                fsm_prompt[pod] = line
+            last_line[pod] = line
+        waiting = [pod for pod in waiting if pod not in fsm_prompt]
+        if waiting and time.monotonic() > deadline:
+            print(f"---- no stable prompt after {PROMPT_READY_TIMEOUT}s on: {' '.join(waiting)}")
+            break
+        if waiting:
+            time.sleep(PROMPT_STABLE_SECONDS)
+    return fsm_prompt
+
+
+def check_all_complete(state, pods_list):
+    """ check if state for all pods is complete """
+    all_complete = True
+    for pod in pods_list:
+        if state[pod] != STEP_COMPLETE:
+            all_complete = False
+    return all_complete
+
+
+def spawn_windows(panes, pods):
+    """ creates pane per each pod, in its own window or tiled with others """
+    if panes.per_window == 1:
+        print(f"spawining {len(pods)} windows")
+    else:
+        print(f"spawining {len(pods)} panes, {panes.per_window} per window")
+    try:
+        panes.spawn(pods)
+    except LayoutError as e:
+        print(f"spawning failed: {e}")
+        sys.exit(1)
+
+
+def tmux_window_per_pod(control, pages, per_window=1, sync=False):
+    """ creates pane per each pod, page by page while pods are still being listed,
+        returns pods list and pod -> pane index """
+    panes = PaneLayout(control, per_window, sync)
+    base = control.cmd('display-message', '-p', '-t', f':{BASE_WINDOW_NAME}', '#{pane_id}')
+    panes.add(BASE_WINDOW_NAME, base.stdout[0])
+    pods_list = []
+    for page in pages:
+        spawn_windows(panes, page)
+        pods_list += page
+    return pods_list, panes
+
+
+def next_step(state, pod):
+    """ move finite state machine to next step """
+    state['fsm_step_executed'][pod] = False
+    state['fsm_attempt'][pod] = 0
+    state['fsm_step'][pod] += 1
+
+
+def initialize_state(pods_list):
+    """ create initial state per each pod """
+    state = {}
+    state['fsm_step'] = {}
+    state['fsm_step_executed'] = {}
+    state['fsm_sent'] = {}
+    state['fsm_wake'] = {}
+    state['fsm_prompt'] = {}
+    # exit code of step whose prompt returned, until it is acted on
+    state['fsm_exit'] = {}
+    state['fsm_attempt'] = {}
+    # last line seen by refresh prompt step, until it is stable
+    state['fsm_refresh'] = {}
+    for pod in pods_list:
+        add_pod_state(state, pod)
+    return state
+
+
+def add_pod_state(state, pod):
+    """ pod starts from first step """
+    state['fsm_step'][pod] = 0
+    state['fsm_step_executed'][pod] = False
+    state['fsm_sent'][pod] = 0
+    state['fsm_wake'][pod] = 0
+    state['fsm_attempt'][pod] = 0
+
+
+def remove_pod_state(state, pod):
+    """ forget pod, so state of long watched run holds live pods only """
+    for values in state.values():
+        values.pop(pod, None)
+
+
+def inform_base_window(pods_list, panes, sequence, info, session_name):
+    """ print basic info of execution to base terminal window """
+    execute = "echo '=========================';"
+    execute += f"echo 'BASE WINDOW FOR SESSION {session_name}';"
+    execute += f"echo 'INFO: {info['context']} {info['namespace']} {info['label_selector']}';"
+    execute += "echo ;"
+    execute += f"echo 'SEQUENCE {sequence}';"
+    execute += "echo 'pods:';"
+    for pod in pods_list:
+        execute += f"echo '   {pod} - '"
+        if p2c(pod.name) != pod.name:
+            execute += f"{p2c(pod.name)}"
+        if p2cLog(pod.name) != pod.name:
+            execute += f", {p2cLog(pod.name)}"
+        execute += ';'
+    execute += "echo ;"
+    execute += "echo 'ctrl+b + n for next pod terminal window';"
+    if panes.per_window > 1:
+        execute += "echo 'ctrl+b + arrows or ctrl+b + q for pod panes within window';"
+    execute += "echo '=========================';"
+    panes.send_keys(BASE_WINDOW_NAME, execute)
+
+
+def prompt_returned(lines, prompt):
+    """ check if last captured line is bare prompt, ie shell is idle again """
+    return bool(lines) and lines[-1].rstrip() == prompt.rstrip()
+
+
+def captured_exit_code(lines):
+    """ exit code echoed on screen, used when pane output stream missed it """
+    for line in reversed(lines):
+        tag, _, code = line.strip().partition('=')
+        if tag == EXIT_TAG and code.isdigit():
+            return int(code)
+    return None
+
+
+def finish_step(pod, state, sequence, info, report):
+    """ prompt returned, by exit code go to next step, retry this one or skip the rest """
+    exit_code = state['fsm_exit'].pop(pod)
+    step = sequence.steps[state['fsm_step'][pod]]
+    if not exit_code:
+        report.done(pod, OUTCOME_OK, exit_code)
+        if step.collect:
+            info['collector'].landed(pod, step)
+        next_step(state, pod)
+        return
+    if state['fsm_attempt'][pod] < step.retries:
+        state['fsm_attempt'][pod] += 1
+        delay = step.retry_delay(state['fsm_attempt'][pod])
+        print(f"{pod} -> exit {exit_code}, retry {state['fsm_attempt'][pod]}/{step.retries} " +
+              f"in {delay}s")
+        report.done(pod, OUTCOME_RETRY, exit_code)
+        # step is sent again once pod wakes up
+        state['fsm_wake'][pod] = time.monotonic() + delay
+        return
+    report.done(pod, OUTCOME_FAILED, exit_code)
+    if step.stop_on_failure:
+        print(f"{pod} -> exit {exit_code}, skipping rest of sequence")
+        state['fsm_step'][pod] = len(sequence.steps)
+        state['fsm_step_executed'][pod] = False
+        return
+    print(f"{pod} -> exit {exit_code}, going on")
+    next_step(state, pod)
+
+
+def pod_gone(state, pod):
+    """ window of pod disappeared, nothing more to execute there """
+    print(f"{pod} -> window gone, dropping pod")
+    state['fsm_step'][pod] = STEP_COMPLETE
+
+
+def pod_complete(state, pod):
+    """ pod has nothing more to execute, or is gone """
+    return state['fsm_step'].get(pod, STEP_COMPLETE) == STEP_COMPLETE
+
+
+def pod_sleeping(state, pod):
+    """ pod is within sleep step """
+    return state['fsm_wake'][pod] > time.monotonic()
+
+
+def pod_woke_up(state, pod):
+    """ pod timer fired while pod was in sleep step """
+    return state['fsm_step'][pod] != STEP_COMPLETE and \
+        not state['fsm_step_executed'][pod] and not pod_sleeping(state, pod)
+
+
+def advance_pod(pod, state, panes, sequence, info, watcher, report):
+    """ run pod steps until pod waits for prompt or sequence is complete """
+    while state['fsm_step'][pod] != STEP_COMPLETE and not state['fsm_step_executed'][pod] \
+            and not pod_sleeping(state, pod):
+        if state['fsm_step'][pod] >= len(sequence.steps):
+            print(f"{pod} -> step complete")
+            state['fsm_step'][pod] = STEP_COMPLETE
+            continue
+        if pod in state['fsm_exit']:
+            finish_step(pod, state, sequence, info, report)
+            continue
+        step = sequence.steps[state['fsm_step'][pod]]
+        if step.kind == STEP_COMMENT:
+            print(f"---# COMMENT: {step.text}")
+            next_step(state, pod)
+            continue
+        if step.kind == STEP_REFRESH:
+            lines = panes.capture(pod)
+            line = lines[-1] if lines else ''
+            # command sent just before might still be running, new prompt is last line
+            # once it stays same for a while
+            if not line or state['fsm_refresh'].get(pod) != line:
+                state['fsm_refresh'][pod] = line
+                state['fsm_wake'][pod] = time.monotonic() + PROMPT_STABLE_SECONDS
+                return
+            del state['fsm_refresh'][pod]
+            state['fsm_prompt'][pod] = line
+            next_step(state, pod)
+            continue
+        if step.kind == STEP_SLEEP:
+            print(f"{pod} executing -> " + step.text)
+            next_step(state, pod)
+            # pod sleeps on scheduler timer, other pods keep going
+            state['fsm_wake'][pod] = time.monotonic() + step.value
+            return
+        if step.kind != STEP_EXEC:
+            next_step(state, pod)
+            continue
+        gate = info['gates'].get(state['fsm_step'][pod])
+        if gate is not None and pod not in gate.in_flight:
+            # step is full, pod waits in line until open_gates lets it through
+            if pod not in gate.pending:
+                gate.add([pod])
+            return
+        print(
+            f"---- {info['cmd']} {pod} step " +
+            f"{state['fsm_step'][pod]} {p2c(pod.name)} ----")
+        execute = step.template.render(pod.template_values())
+        print("executing -> " + execute)
+        watcher.arm(pod)
+        if info['pane_log'] is not None:
+            info['pane_log'].mark(pod, state['fsm_step'][pod], execute)
+        report.sent(pod, state['fsm_step'][pod], execute)
+        if step.no_wait:
+            panes.send_keys(pod, execute)
+            report.done(pod, OUTCOME_NO_WAIT)
+            next_step(state, pod)
+            continue
+        if step.collect:
+            # stdout goes to artifact, exit tag is echoed to terminal
+            panes.send_keys(pod, info['collector'].shell_keys(
+                pod, step, execute + exit_echo(info['shell'], stderr=True), info['shell']))
+        else:
+            panes.send_keys(pod, execute + exit_echo(info['shell']))
+        state['fsm_step_executed'][pod] = True
+        state['fsm_sent'][pod] = time.monotonic()
+
+
+def open_gates(gates, state):
+    """ pods let through steps limited by in flight modifier, in place of pods
+        that moved past the step, retried step keeps its place """
+    released = []
+    for index, gate in gates.items():
+        released += gate.admit(
+            lambda pod, index=index: state['fsm_step'].get(pod, STEP_COMPLETE) != index)
+    return released
+
+
+def check_prompts(pods, state, panes, watcher, scheduler, report, woken):
+    """ move pods whose prompt returned to next step, return pods that advanced """
+    to_check = []
+    now = time.monotonic()
+    for pod in pods:
+        if state['fsm_step'][pod] == STEP_COMPLETE or not state['fsm_step_executed'][pod]:
+            continue
+        if woken and not watcher.is_settled(pod):
+            continue
+        # timer check on unsettled pane is fallback for panes whose output stream got lost
+        if not woken and not watcher.is_settled(pod) and \
+                now - state['fsm_sent'][pod] < scheduler.min_interval:
+            scheduler.backoff(pod)
+            continue
+        to_check.append(pod)
+
+    scheduler.polls += len(to_check)
+    if woken:
+        scheduler.event_polls += len(to_check)
+    captured = panes.capture_many(to_check)
+    advanced = []
+    for pod in to_check:
+        report.polled(pod)
+        if pod not in captured:
+            pod_gone(state, pod)
+            report.done(pod, OUTCOME_GONE)
+            scheduler.cancel(pod)
+            continue
+        if prompt_returned(captured[pod], state['fsm_prompt'][pod]):
+            exit_code = watcher.exit_code(pod)
+            if exit_code is None:
+                exit_code = captured_exit_code(captured[pod])
+            # advance_pod acts on exit code
+            state['fsm_exit'][pod] = exit_code
+            state['fsm_step_executed'][pod] = False
+            scheduler.cancel(pod)
+            advanced.append(pod)
+        elif not woken:
+            scheduler.backoff(pod)
+    return advanced
+
+
+def start_pods(pods, state, panes, watcher):
+    """ wait for shell prompt in windows of pods and stream their output to watcher,
+        returns pods ready to run sequence """
+    state['fsm_prompt'].update(get_fsm_prompt(pods, panes))
+    for pod in pods:
+        if pod not in state['fsm_prompt']:
+            print(f"{pod} -> shell not ready, dropping pod")
+            state['fsm_step'][pod] = STEP_COMPLETE
+    panes.control.batch([('pipe-pane', '-o', '-t', panes.panes[pod], watcher.watch(pod))
+                         for pod in pods if pod in panes])
+    return [pod for pod in pods if not pod_complete(state, pod)]
+
+
+def join_pods(pods, pods_list, state, panes, watcher, admission):
+    """ pods that started running get window and are queued to run sequence """
+    pods = [pod for pod in pods if pod not in state['fsm_step']]
+    if not pods:
+        return
+    print(f"--- {len(pods)} pods joined: {' '.join(str(pod) for pod in pods)}")
+    spawn_windows(panes, pods)
+    for pod in pods:
+        add_pod_state(state, pod)
+    pods_list += pods
+    admission.add(start_pods(pods, state, panes, watcher))
+
+
+def leave_pods(pods, pods_list, state, panes, watcher, scheduler):
+    """ pods that stopped running are forgotten, their windows are kept and marked """
+    for pod in pods:
+        if pod not in state['fsm_step']:
+            continue
+        print(f"{pod} -> pod is gone, window kept")
+        try:
+            panes.cmd(pod, 'pipe-pane')
+            panes.mark_gone(pod)
+        except PaneGone:
+            pass
+        panes.invalidate(pod)
+        watcher.unwatch(pod)
+        scheduler.cancel(pod)
+        remove_pod_state(state, pod)
+        pods_list.remove(pod)
+
+
+def pane_shell(panes, pods_list):
+    """ shell at prompt of pod panes, it decides how exit code is echoed,
+        all panes are started same way so first live one tells """
+    for pod in pods_list:
+        try:
+            lines = panes.cmd(pod, 'display-message', '-p', '#{pane_current_command}')
+        except PaneGone:
+            continue
+        if lines and lines[0]:
+            return lines[0]
+    return 'sh'
+
+
+def execute_fsm(pods_list, panes, sequence, info, membership=None):
+    """ execute finit state machine, sequence , step by step, with membership pods
+        that start or stop running meanwhile are added to or removed from pods_list,
+        returns path of run report summary """
+    state = initialize_state(pods_list)
+    control = panes.control
+    report = RunReport(info['session'], run_dir(info))
+    info['shell'] = pane_shell(panes, pods_list)
+    # step index -> pods waiting for and running step with in flight limit
+    info['gates'] = {index: Admission([], step.in_flight)
+                     for index, step in enumerate(sequence.steps) if step.in_flight}
+
+    print(f"--- working with context {info['context']} namespace {info['namespace']}")
+    watcher = PaneWatcher(info['pane_log'])
+    scheduler = Scheduler()
+    admission = Admission(start_pods(pods_list, state, panes, watcher),
+                          info['max_in_flight'], info['wave'] == WAVE_BATCH)
+    deadline = time.monotonic() + (info['watch'] or 0)
+    if membership is not None:
+        watcher.wake_on(membership.fileno())
+    try:
+        runnable = []
+        while True:
+            for pod in runnable:
+                try:
+                    advance_pod(pod, state, panes, sequence, info, watcher, report)
+                except PaneGone:
+                    pod_gone(state, pod)
+                    report.done(pod, OUTCOME_GONE)
+                    continue
+                if state['fsm_step_executed'][pod]:
+                    scheduler.reset(pod)
+                elif pod_sleeping(state, pod):
+                    scheduler.schedule(pod, state['fsm_wake'][pod] - time.monotonic())
+
+            runnable = admission.admit(lambda pod: pod_complete(state, pod))
+            if runnable and info['max_in_flight']:
+                print(f"--- starting {len(runnable)} pods, {admission.waiting()} waiting")
+            runnable += open_gates(info['gates'], state)
+            if runnable:
+                continue
+            done = check_all_complete(state['fsm_step'], pods_list)
+            # watched run lasts at least until deadline, so late pods are covered too
+            if done and (membership is None or time.monotonic() >= deadline):
+                print("all complete")
+                break
+
+            active = scheduler.wait(watcher, deadline - time.monotonic() if done else None)
+            runnable = check_prompts(active, state, panes, watcher, scheduler, report, True)
+            due = scheduler.pop_due()
+            runnable += [pod for pod in due if pod_woke_up(state, pod)]
+            runnable += check_prompts(due, state, panes, watcher, scheduler, report, False)
+            if membership is not None:
+                added, gone = membership.pending()
+                leave_pods(gone, pods_list, state, panes, watcher, scheduler)
+                for pod in gone:
+                    report.done(pod, OUTCOME_GONE)
+                admission.discard(gone)
+                for gate in info['gates'].values():
+                    gate.discard(gone)
+                join_pods(added, pods_list, state, panes, watcher, admission)
+                runnable = [pod for pod in runnable if pod in state['fsm_step']]
+    finally:
+        watcher.close()
+        print(f"--- scheduler: {scheduler.report()}")
+        report.finish()
+        summary = report.summary(control)
+        for line in summary:
+            print(f"--- {line}")
+        report_path = report.write(summary)
+    return report_path
+
+
+def new_tmux_session(tmux_server, session_name):
+    """ get new tmux session """
+    tmux_server.cmd('new-session', '-d', '-P', '-F#{session_id}', '-s', session_name)
+    sess_handle = tmux_server.sessions.get(session_name=session_name)
+    tmux_server.cmd('rename-window', '-t', f'{session_name}:{0}', BASE_WINDOW_NAME)
+    print(f"==== new session {session_name} created")
+    return sess_handle
+
+
+def check_session(session_name, tmux_server):
+    """ check if session already exist, and if it does exit """
+    tmux_session_exist = True
+    try:
+        tmux_server.sessions.get(session_name=session_name)
+    except ObjectDoesNotExist:
+        tmux_session_exist = False
+
+    if tmux_session_exist:
+        print(f"tmux session {session_name} already exist try:")
+        print(f"terminating with: tmux kill-session -t {session_name}")
+        print(f"attach with: tmux attach-session -t {session_name}")
+        print("exiting")
+        sys.exit(5)
+
+
+def waiting_message(session_name):
+    """ final message before waiting """
+    print(f"--- waiting {SLEEP_TIME} seconds before closing ---")
+    print(f"--- after {SLEEP_TIME} program will exit and leave all tmux_sessions ---")
+    print("--- ctr+c will exit and leave all tmux sessions ---")
+    print(f"--- \tattach with: tmux attach-session -t {session_name} ---")
+    print("---  or: ---")
+    print(f"--- \tremove with: tmux kill-session -t {session_name} ---")
+    print("--- ctr+\\ will exit and terminate all tmux sessions ---")
+
+
+def first_page(pages):
+    """ wait until first pods are listed, exit if none are selected """
+    for page in pages:
+        if page:
+            return itertools.chain([page], pages)
+    print("no pods selected, exiting")
+    sys.exit(6)
+
+
+def display_pods_and_containers(pods_list):
+    """ display selected pods and containers """
+    print("----- selected pods and containers -----")
+    for pod in pods_list:
+        print(f"pod: {pod}, container: {p2c(pod.name)}")
+    print("-----------")
+
+
+def run_dir(info):
+    """ directory of all run outputs, artifacts, pane logs, report and aggregate,
+        named once per run and created on first use """
+    if 'run_dir' not in info:
+        info['run_dir'] = os.path.abspath(
+            os.path.join(OUTPUT_DIR, f"{info['session']}-{time.strftime('%Y%m%d-%H%M%S')}"))
+    os.makedirs(info['run_dir'], exist_ok=True)
+    return info['run_dir']
+
+
+def scrollback_dir(options, info):
+    """ directory scrollback is saved to on terminate, None if it is not saved """
+    if 'save-scrollback' not in options:
+        return None
+    return options['save-scrollback'] or run_dir(info)
+
+
+def aggregate_outputs(pods_list, sequence, info):
+    """ group pods by output of each step, collected artifacts and pane logs are streamed,
+        headless step output is already in aggregator, returns path of report """
+    aggregator = info['aggregator']
+    rows = load_index(info['pane_log'].log_dir) if info['pane_log'] is not None else {}
+    for index, step in enumerate(sequence.steps):
+        if step.kind != STEP_EXEC or step.no_wait:
+            continue
+        label = step.collect or step.text.split(' -- ')[-1]
+        for pod in pods_list:
+            if step.collect:
+                aggregator.add_file(pod, index, label, info['collector'].output_path(pod, step))
+                continue
+            pod_rows = rows.get(str(pod), [])
+            # pods that never got to step are left out
+            if any(row['step'] == str(index) for row in pod_rows):
+                aggregator.add(pod, index, label, pane_output(iter_lines(
+                    iter_step(info['pane_log'].log_dir, pod_rows, str(index))), EXIT_TAG))
+    path = os.path.join(run_dir(info), REPORT_NAME)
+    for line in aggregator.write(path):
+        print(line)
+    print(f"--- aggregate report in {path}")
+    return path
+
+
+def save_scrollback(captured, save_dir):
+    """ write captured scrollback of each pod to its own file """
+    try:
+        os.makedirs(save_dir, exist_ok=True)
+        for pod, lines in captured.items():
+            name = str(pod).replace('/', '_') + '.scrollback'
+            with open(os.path.join(save_dir, name), 'w', encoding='utf-8') as f:
+                f.write('\n'.join(lines) + '\n')
+    except OSError as e:
+        print(f"can't save scrollback to {save_dir}: {e}")
+        return
+    print(f"--- scrollback of {len(captured)} panes saved in {save_dir}")
+
+
+def terminate_tmux(control, panes, save_dir=None):
+    """ print last lines of all panes, captured in one batch, optionally save their scrollback,
+        then kill only this session, other sessions of tmux server are left alone """
+    start = time.monotonic()
+    try:
+        captured = panes.capture_many(list(panes.panes), history=save_dir is not None)
+    except ControlModeError as q:
+        print(q)
+        captured = {}
+    for pod, lines in captured.items():
+        if len(lines) > 3:
+            print("->" + lines[-3] + " - " + lines[-2])
+        elif lines:
+            print("->" + lines[0])
+        print(f"terminating {pod}")
+    if save_dir is not None:
+        save_scrollback(captured, save_dir)
+    control.close()
+    # closing ptys of hundreds of panes keeps tmux server busy for a few ms each,
+    # it is done in background, not waited for
+    control.spawn('kill-session', '-t', f'={control.session_name}')
+    print(f"--- session {control.session_name} terminated in {time.monotonic() - start:.2f}s")
+
+
+def final_exec(sequence, pods_list):
+    """ run final exec step on local machine, once all pods are done,
+        once per context and namespace of pods, all of them at the same time """
+    parsed_execs = {}
+    for pod in pods_list:
+        parsed_exec = sequence.steps[-1].template.render(
+            {'k8s_context': pod.context, 'k8s_namespace': pod.namespace})
+        parsed_execs[parsed_exec] = True
+    pids = []
+    for parsed_exec in parsed_execs:
+        print(f"--- final_exec: {parsed_exec}")
+        pid = os.fork()
+        if pid == 0:
+            os.system(parsed_exec)
+            os._exit(0)
+        pids.append(pid)
+    for pid in pids:
+        os.waitpid(pid, 0)
+
+
+def run(sequence, info, options):
+    """ list pods and run sequence on them, headless or each in tmux pane, then attach,
+        terminate or wait as last step of sequence tells, info is filled in by cli """
+    session_name = info['session']
+    pages = discover_pod_pages(
+        info['context'].split(','), info['namespace'].split(','),
+        info['label_selector'], "status.phase=Running", 'refresh' in options)
+    if info['pods_filter']:
+        pages = ([pod for pod in page if pod.name in info['pods_filter']] for page in pages)
+    pages = first_page(pages)
+
+    info['collector'] = Collector(run_dir(info)) if sequence.collects else None
+    info['pane_log'] = None
+    info['aggregator'] = Aggregator() if 'aggregate' in options else None
+    if sequence.headless:
+        if info['watch'] is not None:
+            print("--- --watch is ignored, headless sequence runs on listed pods only")
+        if info['log_compression'] is not None:
+            print("--- --log-panes is ignored, headless sequence has no panes")
+        pods_list = [pod for page in pages for pod in page]
+        display_pods_and_containers(pods_list)
+        execute_headless(pods_list, sequence, info, info['max_in_flight'] or HEADLESS_WORKERS,
+                         info['wave'] == WAVE_BATCH)
+        if info['collector'] is not None:
+            info['collector'].close()
+        if info['aggregator'] is not None:
+            aggregate_outputs(pods_list, sequence, info)
+        if sequence.final == STEP_FINAL_EXEC:
+            final_exec(sequence, pods_list)
+        return
+
+    tmux_server = libtmux.Server()
+    check_session(session_name, tmux_server)
+    new_tmux_session(tmux_server, session_name)
+    control = TmuxControl(tmux_server, session_name)
+
+    def terminate_all():
+        """ terminate session """
+        terminate_tmux(control, panes, scrollback_dir(options, info))
+
+    def signal_handler_terminate(sig, _):
+        """ set signal handler for ctr+c """
+        print(f'You pressed Ctrl+C! {sig}, terminating tmux windows')
+        terminate_all()
+        sys.exit(0)
+
+    signal.signal(signal.SIGINT, signal_handler_detach)
+    signal.signal(signal.SIGQUIT, signal.SIG_IGN)
+    print("--- ctr+c will exit and leave all tmux sessions," +
+          "sequence execution will be partially done ---")
+    print("--- ctr+\\ will be ignored  ---")
+
+    pods_list, panes = tmux_window_per_pod(control, pages, info['per_window'],
+                                           info['sync_panes'])
+    display_pods_and_containers(pods_list)
+    membership = None
+    if info['watch'] is not None:
+        membership = PodMembership(LISTED_VERSIONS, LISTED_LABELS, pods_list, info['pods_filter'] or None)
+    if info['log_compression'] is not None:
+        info['pane_log'] = PaneLog(run_dir(info), info['log_compression'])
+    report_path = execute_fsm(pods_list, panes, sequence, info, membership)
+    if info['pane_log'] is not None:
+        info['pane_log'].close()
+    if membership is not None:
+        membership.stop()
+    if info['collector'] is not None:
+        info['collector'].close()
+    if info['aggregator'] is not None:
+        aggregate_path = aggregate_outputs(pods_list, sequence, info)
+    inform_base_window(pods_list, panes, info['cmd'], info, session_name)
+    panes.sync_input()
+    panes.send_keys(BASE_WINDOW_NAME, f"cat {shlex.quote(os.path.abspath(report_path))}")
+    if info['aggregator'] is not None:
+        panes.send_keys(BASE_WINDOW_NAME, f"cat {shlex.quote(aggregate_path)}")
+
+    print("--- all executable sequence steps are executed ---")
+    signal.signal(signal.SIGQUIT, signal_handler_terminate)
+    if sequence.final == STEP_ATTACH:
+        print("--- attaching tmux ---")
+        os.execve(
+            '/bin/sh',
+            ['/bin/sh', '-c', f'tmux attach-session -t {session_name}'],
+            os.environ)
+    elif sequence.final == STEP_TERMINATE:
+        terminate_all()
+    elif sequence.final == STEP_FINAL_EXEC:
+        final_exec(sequence, pods_list)
+        print("final exec complete, terminating sessions")
+        terminate_all()
+    else:
+        waiting_message(session_name)
+        time.sleep(SLEEP_TIME)
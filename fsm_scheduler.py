@@ -0,0 +1,126 @@
+""" this module schedules per pod prompt checks for the finite state machine """
+
+import collections
+import heapq
+import itertools
+import time
+
+POLL_MIN_SECONDS = 2
+POLL_MAX_SECONDS = 60
+
+
+class Scheduler:
+    """ priority queue of pods keyed on next check time, with per pod backoff """
+
+    def __init__(self, min_interval=POLL_MIN_SECONDS, max_interval=POLL_MAX_SECONDS):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.queue = []
+        self.due = {}
+        self.interval = {}
+        self.counter = itertools.count()
+        self.started = time.monotonic()
+        self.polls = 0
+        self.event_polls = 0
+        self.idle_seconds = 0.0
+
+    def schedule(self, pod, delay):
+        """ (re)schedule pod check after delay seconds, older entry of pod is dropped """
+        due = time.monotonic() + delay
+        self.due[pod] = due
+        heapq.heappush(self.queue, (due, next(self.counter), pod))
+
+    def reset(self, pod):
+        """ pod advanced, start checking it with shortest interval """
+        self.interval[pod] = self.min_interval
+        self.schedule(pod, self.min_interval)
+
+    def backoff(self, pod):
+        """ pod still running its step, double its interval up to max """
+        self.interval[pod] = min(
+            self.interval.get(pod, self.min_interval) * 2, self.max_interval)
+        self.schedule(pod, self.interval[pod])
+
+    def cancel(self, pod):
+        """ pod needs no more checks """
+        self.due.pop(pod, None)
+        self.interval.pop(pod, None)
+
+    def _drop_stale(self):
+        """ pop heap entries that were rescheduled or cancelled """
+        while self.queue and self.due.get(self.queue[0][2]) != self.queue[0][0]:
+            heapq.heappop(self.queue)
+
+    def timeout(self):
+        """ seconds until first pod is due, None if nothing is scheduled """
+        self._drop_stale()
+        if not self.queue:
+            return None
+        return max(0.0, self.queue[0][0] - time.monotonic())
+
+    def pop_due(self):
+        """ return pods which are due for check, they are unscheduled """
+        now = time.monotonic()
+        pods = []
+        self._drop_stale()
+        while self.queue and self.queue[0][0] <= now:
+            _, _, pod = heapq.heappop(self.queue)
+            del self.due[pod]
+            pods.append(pod)
+            self._drop_stale()
+        return pods
+
+    def wait(self, watcher, limit=None):
+        """ block on pane output until first pod is due, or at most limit seconds,
+            count time spent idle """
+        timeout = self.timeout()
+        if timeout is None:
+            timeout = self.max_interval
+        if limit is not None:
+            timeout = max(0.0, min(timeout, limit))
+        start = time.monotonic()
+        active = watcher.wait(timeout)
+        self.idle_seconds += time.monotonic() - start
+        return active
+
+    def report(self):
+        """ one line summary of polling cost """
+        elapsed = time.monotonic() - self.started
+        return (f"{self.polls} prompt polls ({self.event_polls} woken by output), " +
+                f"idle {self.idle_seconds:.1f}s of {elapsed:.1f}s")
+
+
+class Admission:
+    """ limits how many pods run sequence at once, pods wait in order they were given """
+
+    def __init__(self, pods, limit=0, batch=False):
+        self.pending = collections.deque(pods)
+        self.limit = limit
+        self.batch = batch
+        self.in_flight = []
+
+    def admit(self, is_done):
+        """ forget pods which are done, return pods started in their place """
+        self.in_flight = [pod for pod in self.in_flight if not is_done(pod)]
+        if self.batch and self.in_flight:
+            return []
+        started = []
+        while self.pending and (not self.limit or len(self.in_flight) < self.limit):
+            pod = self.pending.popleft()
+            self.in_flight.append(pod)
+            started.append(pod)
+        return started
+
+    def add(self, pods):
+        """ queue pods that joined while running """
+        self.pending.extend(pods)
+
+    def discard(self, pods):
+        """ forget pods that are gone, whether started or not """
+        gone = set(pods)
+        self.pending = collections.deque(pod for pod in self.pending if pod not in gone)
+        self.in_flight = [pod for pod in self.in_flight if pod not in gone]
+
+    def waiting(self):
+        """ number of pods not yet started """
+        return len(self.pending)
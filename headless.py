@@ -0,0 +1,118 @@
+""" this module runs non interactive sequences without tmux, on bounded pool of workers """
+
+import contextlib
+import os
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from collect import stream_to_file
+from seq_template import STEP_EXEC, STEP_COMMENT, STEP_SLEEP
+
+HEADLESS_WORKERS = 32
+OUTPUT_TAIL_LINES = 3
+# step without in flight limit
+NO_GATE = contextlib.nullcontext()
+
+
+class PodResult:
+    """ outcome of sequence on one pod """
+
+    def __init__(self, pod):
+        self.pod = pod
+        self.steps = []
+        self.failed_step = None
+
+    def add(self, index, returncode, output):
+        """ record executed step, keep only tail of its output """
+        self.steps.append((index, returncode, output.splitlines()[-OUTPUT_TAIL_LINES:]))
+        if returncode != 0 and self.failed_step is None:
+            self.failed_step = index
+
+
+def run_step(command, shell, artifact=None):
+    """ run one step, returns exit code and output, stdout of collecting step goes to artifact
+        and only stderr is returned """
+    if artifact is not None:
+        return stream_to_file(command, artifact, shell)
+    proc = subprocess.run(
+        command, shell=True, executable=shell, check=False,
+        stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+        encoding='utf-8', errors='backslashreplace')
+    return proc.returncode, proc.stdout
+
+
+def run_pod(pod, sequence, collector=None, aggregator=None, gates=None):
+    """ run all sequence steps on one pod, one after another, failed step is retried
+        as many times as its retry modifier allows, step that still fails stops sequence
+        only if it is marked stop on failure, like in tmux,
+        output of steps that do not collect goes to aggregator,
+        gates limit how many pods run step with in flight modifier at once """
+    result = PodResult(pod)
+    values = pod.template_values()
+    shell = os.environ.get('SHELL', '/bin/sh')
+    for index, step in enumerate(sequence.steps):
+        if step.kind == STEP_SLEEP:
+            time.sleep(step.value)
+            continue
+        if step.kind != STEP_EXEC:
+            continue
+        artifact = collector.path(pod, step) if step.collect else None
+        # retries keep their place in gate
+        with (gates or {}).get(index, NO_GATE):
+            for attempt in range(step.retries + 1):
+                if attempt:
+                    time.sleep(step.retry_delay(attempt))
+                returncode, output = run_step(step.template.render(values), shell, artifact)
+                if returncode == 0:
+                    break
+        result.add(index, returncode, output)
+        if aggregator is not None and not step.collect:
+            aggregator.add(pod, index, step.text.split(' -- ')[-1], output.splitlines())
+        if returncode != 0:
+            if step.stop_on_failure:
+                break
+            continue
+        if step.collect:
+            collector.landed(pod, step)
+    return result
+
+
+def print_result(result):
+    """ print exit code and output tail of each executed step """
+    for index, returncode, tail in result.steps:
+        print(f"{result.pod} step {index} -> exit {returncode}")
+        for line in tail:
+            print(f"    {line}")
+
+
+def execute_headless(pods_list, sequence, info, workers=HEADLESS_WORKERS, batch=False):
+    """ run sequence on all pods, at most workers pods at once, returns failed pods,
+        in batch mode next workers pods start only once whole previous batch is done """
+    for step in sequence.steps:
+        if step.kind == STEP_COMMENT:
+            print(f"---# COMMENT: {step.text}")
+    print(f"--- headless {info['cmd']} on {len(pods_list)} pods, {workers} at once" +
+          (" in batches" if batch else ""))
+    waves = [pods_list]
+    if batch:
+        waves = [pods_list[i:i + workers] for i in range(0, len(pods_list), workers)]
+    gates = {index: threading.BoundedSemaphore(step.in_flight)
+             for index, step in enumerate(sequence.steps) if step.in_flight}
+    failed = []
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for wave in waves:
+            futures = [pool.submit(run_pod, pod, sequence, info['collector'],
+                                   info['aggregator'], gates) for pod in wave]
+            for future in as_completed(futures):
+                result = future.result()
+                print_result(result)
+                if result.failed_step is not None:
+                    failed.append(result.pod)
+    print(f"--- headless done in {time.monotonic() - start:.1f}s, " +
+          f"{len(pods_list) - len(failed)} ok, {len(failed)} failed")
+    for pod in failed:
+        print(f"    failed: {pod}")
+    return failed
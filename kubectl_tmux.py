@@ -2,7 +2,14 @@
 """ kubectl plugin for tmux_k8s """
 
 import argparse
-import os
+import shlex
+import sys
+
+import tmux_k8s
+
+# these flags take value only as --flag=value, bare flag gets value given here,
+# so flag placed before positionals does not swallow sequence name
+OPTIONAL_VALUE_FLAGS = {'--watch': '0', '--save-scrollback': '', '--log-panes': ''}
 
 
 def main():
@@ -14,13 +21,28 @@ def main():
     parser.add_argument('--context', type=ascii, help="context")
     parser.add_argument('--namespace', '-n', type=ascii, help="namespace")
     parser.add_argument('--selector', '-l', type=ascii, help='label selector')
+    parser.add_argument('--max-in-flight', type=int, help='max pods running sequence at once')
+    parser.add_argument('--wave', choices=['rolling', 'batch'], help='how waiting pods start')
+    parser.add_argument('--refresh', action='store_true', help='do not use cached pod lists')
+    parser.add_argument('--watch', type=int, metavar='=SECONDS',
+                        help='also run on pods that start meanwhile, for at least seconds')
+    parser.add_argument('--panes-per-window', type=int, help='pods per window, as tiled panes')
+    parser.add_argument('--sync-panes', action='store_true',
+                        help='once done, keys typed go to all panes of window')
+    parser.add_argument('--save-scrollback', metavar='=DIR',
+                        help='on terminate save scrollback of each pod, to directory')
+    parser.add_argument('--log-panes', choices=['', 'gzip', 'zstd', 'none'], metavar='=COMPRESSION',
+                        help='stream pane output of each pod to indexed logs, compressed')
+    parser.add_argument('--aggregate', action='store_true',
+                        help='group pods by identical step output, diff outliers')
 
     parser.add_argument('sequence', type=ascii, help='sequence')
     parser.add_argument('get', type=ascii, help='get')
     parser.add_argument('object', type=ascii, help='object')
     parser.add_argument('names', nargs='*', type=ascii, help='object')
 
-    args = parser.parse_args()
+    args = parser.parse_args([arg + '=' + OPTIONAL_VALUE_FLAGS[arg] if arg in OPTIONAL_VALUE_FLAGS
+                              else arg for arg in sys.argv[1:]])
 
     if args.get[1:-1] != 'get':
         parser.error("arg.get should be get")
@@ -31,26 +53,57 @@ def main():
             line.join(f"{obj} ")
         parser.error("arg object should be one of: " + line)
 
-    arg_list = ""
+    # tmux_k8s args, as if given on its command line
+    arg_list = ['tmux_k8s', args.sequence[1:-1]]
 
     value = getattr(args, 'context', None)
     if value:
-        arg_list += " " + value[1:-1]
+        arg_list.append(value[1:-1])
 
     value = getattr(args, 'namespace', None)
     if value:
-        arg_list += " " + value[1:-1]
+        arg_list.append(value[1:-1])
 
     value = getattr(args, 'selector', None)
     if value:
-        arg_list += " " + value[1:-1]
+        arg_list.append(value[1:-1])
 
     value = getattr(args, 'names', None)
     if value:
-        arg_list += " " + ",".join(value)
+        arg_list.append(",".join(name[1:-1] for name in value))
+
+    if args.max_in_flight is not None:
+        arg_list.append(f"--max-in-flight={args.max_in_flight}")
+
+    if args.wave:
+        arg_list.append(f"--wave={args.wave}")
+
+    if args.refresh:
+        arg_list.append("--refresh")
+
+    if args.watch is not None:
+        arg_list.append(f"--watch={args.watch}")
+
+    if args.panes_per_window is not None:
+        arg_list.append(f"--panes-per-window={args.panes_per_window}")
+
+    if args.sync_panes:
+        arg_list.append("--sync-panes")
+
+    if args.save_scrollback is not None:
+        arg_list.append(f"--save-scrollback={args.save_scrollback}" if args.save_scrollback
+                        else "--save-scrollback")
+
+    if args.log_panes is not None:
+        arg_list.append(f"--log-panes={args.log_panes}" if args.log_panes else "--log-panes")
+
+    if args.aggregate:
+        arg_list.append("--aggregate")
 
-    print(f"tmux_k8s {args.sequence[1:-1]} {arg_list}")
-    os.system(f"tmux_k8s {args.sequence[1:-1]} {arg_list}")
+    print(shlex.join(arg_list))
+    # run in this process, no shell and no second interpreter startup,
+    # args are passed as list so globs and selectors need no quoting
+    tmux_k8s.main(arg_list)
 
 
 if __name__ == '__main__':
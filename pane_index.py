@@ -0,0 +1,57 @@
+""" this module keeps pod to tmux pane id index, so pane commands need no lookups """
+
+
+class PaneGone(Exception):
+    """ pane of pod disappeared, pod is dropped from index """
+
+
+class PaneIndex:
+    """ pod -> pane id, built once while windows are spawned """
+
+    def __init__(self, control):
+        self.control = control
+        self.panes = {}
+
+    def add(self, pod, pane_id):
+        """ register pane id of pod """
+        self.panes[pod] = pane_id
+
+    def invalidate(self, pod):
+        """ drop pod, its window is gone """
+        self.panes.pop(pod, None)
+
+    def __contains__(self, pod):
+        return pod in self.panes
+
+    def cmd(self, pod, command, *args):
+        """ run tmux command targeting pane of pod, return stdout lines """
+        if pod not in self.panes:
+            raise PaneGone(pod)
+        proc = self.control.cmd(command, '-t', self.panes[pod], *args)
+        if proc.stderr and "can't find" in proc.stderr[0]:
+            self.invalidate(pod)
+            raise PaneGone(pod)
+        return proc.stdout
+
+    def capture(self, pod):
+        """ visible lines of pod pane """
+        return self.cmd(pod, 'capture-pane', '-p')
+
+    def capture_many(self, pods, history=False):
+        """ visible lines, or whole scrollback with wrapped lines joined, of many pod panes
+            in one round trip, gone panes are left out """
+        live = [pod for pod in pods if pod in self.panes]
+        extra = ('-J', '-S', '-') if history else ()
+        results = self.control.batch(
+            [('capture-pane', '-p', *extra, '-t', self.panes[pod]) for pod in live])
+        captured = {}
+        for pod, proc in zip(live, results):
+            if proc.stderr and "can't find" in proc.stderr[0]:
+                self.invalidate(pod)
+                continue
+            captured[pod] = proc.stdout
+        return captured
+
+    def send_keys(self, pod, keys):
+        """ type keys into pod pane and press enter """
+        self.cmd(pod, 'send-keys', keys, 'Enter')
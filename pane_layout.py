@@ -0,0 +1,91 @@
+""" this module packs pod panes into tmux windows, one or more tiled panes per window """
+
+from pane_index import PaneIndex
+
+# pane option holding pod label, shown in pane border when window has many panes
+POD_OPTION = '@pod'
+
+
+class LayoutError(Exception):
+    """ tmux refused to create window or pane """
+
+
+class PaneLayout(PaneIndex):
+    """ pod -> pane index whose panes are created per_window at a time in tiled windows,
+        pods joining later fill up last window first """
+
+    def __init__(self, control, per_window=1, sync=False):
+        super().__init__(control)
+        self.per_window = per_window
+        self.sync = sync
+        self.windows = []
+        # panes in last window
+        self.filled = 0
+
+    def _new_windows(self, count):
+        """ create windows in one batch, returns (window id, first pane id) list """
+        first = len(self.windows) + 1
+        created = self.control.batch(
+            [('new-window', '-d', '-P', '-F', '#{window_id} #{pane_id}', '-n', f'pods-{index}')
+             for index in range(first, first + count)])
+        windows = []
+        for result in created:
+            if not result.stdout:
+                raise LayoutError(f"new window: {result.stderr}")
+            windows.append(tuple(result.stdout[0].split(' ')))
+        return windows
+
+    def _spawn_windows(self, pods):
+        """ one window per pod, named after it """
+        created = self.control.batch(
+            [('new-window', '-d', '-P', '-F', '#{pane_id}', '-n', str(pod)) for pod in pods])
+        for pod, result in zip(pods, created):
+            if not result.stdout:
+                raise LayoutError(f"window for {pod}: {result.stderr}")
+            self.add(pod, result.stdout[0])
+
+    def spawn(self, pods):
+        """ create panes of pods, two batches, windows first then panes split within them """
+        if self.per_window == 1:
+            self._spawn_windows(pods)
+            return
+        free = self.per_window - self.filled if self.windows else 0
+        fresh = self._new_windows(-(-(len(pods) - free) // self.per_window))
+        commands = []
+        splits = []
+        for window, first_pane in fresh:
+            commands += [('set-option', '-w', '-t', window, 'pane-border-status', 'top'),
+                         ('set-option', '-w', '-t', window, 'pane-border-format',
+                          f' #{{{POD_OPTION}}} ')]
+        for index, pod in enumerate(pods):
+            if index >= free and (index - free) % self.per_window == 0:
+                window, first_pane = fresh[(index - free) // self.per_window]
+                self.windows.append(window)
+                self.filled = 1
+                self.add(pod, first_pane)
+                commands.append(('set-option', '-p', '-t', first_pane, POD_OPTION, str(pod)))
+                continue
+            splits.append((pod, len(commands)))
+            commands += [('split-window', '-d', '-t', self.windows[-1], '-P', '-F', '#{pane_id}'),
+                         ('select-layout', '-t', self.windows[-1], 'tiled')]
+            self.filled += 1
+        results = self.control.batch(commands)
+        for pod, position in splits:
+            if not results[position].stdout:
+                raise LayoutError(f"pane for {pod}: {results[position].stderr}")
+            self.add(pod, results[position].stdout[0])
+        self.control.batch([('set-option', '-p', '-t', self.panes[pod], POD_OPTION, str(pod))
+                            for pod, _ in splits])
+
+    def mark_gone(self, pod):
+        """ label window, or pane if window is shared, of pod that is gone """
+        if self.per_window == 1:
+            self.cmd(pod, 'rename-window', f'{pod} (gone)')
+        else:
+            self.cmd(pod, 'set-option', '-p', POD_OPTION, f'{pod} (gone)')
+
+    def sync_input(self):
+        """ once sequence is done, keys typed into one pane go to all panes of its window """
+        if self.sync and self.windows:
+            self.control.batch([('set-option', '-w', '-t', window, 'synchronize-panes', 'on')
+                                for window in self.windows])
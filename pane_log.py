@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+""" this module writes pane output of each pod into compressed, size rotated log files,
+    with index of where output of each step starts, so one step is read without scanning logs """
+
+import csv
+import gzip
+import os
+import sys
+import time
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+LOG_ROTATE_BYTES = int(os.environ.get('TMUX_K8S_LOG_ROTATE_BYTES', str(64 * 1024 * 1024)))
+# output buffered per pod is compressed and written once it grows this big or step changes
+BLOCK_BYTES = 1024 * 1024
+COMPRESSIONS = ('gzip', 'zstd', 'none')
+SUFFIXES = {'gzip': '.gz', 'zstd': '.zst', 'none': ''}
+INDEX_NAME = 'panes.index.csv'
+# each row is one block, gzip member or zstd frame, of one pod log starting at offset
+INDEX_FIELDS = ('pod', 'step', 'file', 'offset', 'time', 'command')
+
+
+def compression_error(compression):
+    """ why compression can't be used, None if it can """
+    if compression not in COMPRESSIONS:
+        return f"unknown compression {compression}, use one of {', '.join(COMPRESSIONS)}"
+    if compression == 'zstd' and zstandard is None:
+        return "zstd compression needs zstandard python package"
+    return None
+
+
+def compress(data, compression):
+    """ data as one gzip member or zstd frame """
+    if compression == 'gzip':
+        return gzip.compress(data, compresslevel=6)
+    if compression == 'zstd':
+        return zstandard.ZstdCompressor().compress(data)
+    return data
+
+
+def decompress(data, compression):
+    """ one block of log back to pane output """
+    if not data or compression == 'none':
+        return data
+    if compression == 'gzip':
+        return gzip.decompress(data)
+    return zstandard.ZstdDecompressor().decompress(data)
+
+
+class PaneLog:
+    """ per pod logs of pane output, fed from pane watcher stream """
+
+    def __init__(self, log_dir, compression='gzip', rotate_bytes=LOG_ROTATE_BYTES):
+        self.log_dir = log_dir
+        self.compression = compression
+        self.rotate_bytes = rotate_bytes
+        os.makedirs(log_dir, exist_ok=True)
+        self.index_file = open(  # pylint: disable=consider-using-with
+            os.path.join(log_dir, INDEX_NAME), 'w', encoding='utf-8', newline='')
+        self.index = csv.writer(self.index_file)
+        self.index.writerow(INDEX_FIELDS)
+        # pod -> [step, command, started, chunks, size] of output not written yet
+        self.pending = {}
+        self.parts = {}
+        self.written = 0
+
+    def path(self, pod):
+        """ current log file of pod """
+        suffix = SUFFIXES[self.compression]
+        return os.path.join(self.log_dir,
+                            f"{str(pod).replace('/', '_')}.{self.parts.get(pod, 0)}.log{suffix}")
+
+    def write(self, pod, data):
+        """ output of pod pane """
+        if not data:
+            return
+        block = self.pending.setdefault(pod, ['', '', time.time(), [], 0])
+        block[3].append(data)
+        block[4] += len(data)
+        if block[4] >= BLOCK_BYTES:
+            self.flush(pod)
+            # rest of step goes on in next block
+            self.pending[pod] = [block[0], '', time.time(), [], 0]
+
+    def mark(self, pod, step, command):
+        """ keys of step are about to be sent to pod, its output starts here """
+        self.flush(pod)
+        self.pending[pod] = [step, command, time.time(), [], 0]
+
+    def flush(self, pod):
+        """ compress buffered output of pod into its log, rotated once it is big enough """
+        block = self.pending.pop(pod, None)
+        if block is None:
+            return
+        step, command, started, chunks, _ = block
+        path = self.path(pod)
+        offset = os.path.getsize(path) if os.path.exists(path) else 0
+        if offset >= self.rotate_bytes:
+            self.parts[pod] = self.parts.get(pod, 0) + 1
+            path = self.path(pod)
+            offset = 0
+        data = compress(b''.join(chunks), self.compression) if chunks else b''
+        with open(path, 'ab') as f:
+            f.write(data)
+        self.written += len(data)
+        self.index.writerow((str(pod), step, os.path.basename(path), offset,
+                             round(started, 3), command))
+
+    def close(self):
+        """ write output still buffered, print where logs are """
+        for pod in list(self.pending):
+            self.flush(pod)
+        self.index_file.close()
+        print(f"--- pane logs, {self.written} bytes, in {self.log_dir}")
+
+
+def load_index(log_dir):
+    """ index rows of all pods, pod -> its rows in order they were written """
+    rows = {}
+    with open(os.path.join(log_dir, INDEX_NAME), encoding='utf-8', newline='') as f:
+        for row in csv.DictReader(f):
+            rows.setdefault(row['pod'], []).append(row)
+    return rows
+
+
+def read_index(log_dir, pod):
+    """ index rows of pod, in order they were written """
+    return load_index(log_dir).get(pod, [])
+
+
+def iter_step(log_dir, rows, step):
+    """ pane output of step, one decompressed block at a time, rows are index rows of pod,
+        only blocks of step are read """
+    compression = next((name for name, suffix in SUFFIXES.items()
+                        if suffix and rows and rows[0]['file'].endswith(suffix)), 'none')
+    for position, row in enumerate(rows):
+        if row['step'] != step:
+            continue
+        # block ends where next block of same file starts
+        end = next((int(later['offset']) for later in rows[position + 1:]
+                    if later['file'] == row['file']), None)
+        with open(os.path.join(log_dir, row['file']), 'rb') as f:
+            f.seek(int(row['offset']))
+            data = f.read() if end is None else f.read(end - int(row['offset']))
+        yield decompress(data, compression)
+
+
+def read_step(log_dir, pod, step):
+    """ pane output of step of pod """
+    return b''.join(iter_step(log_dir, read_index(log_dir, pod), step))
+
+
+def main():
+    """ list steps logged for pod, or print pane output of one of its steps """
+    if len(sys.argv) not in (3, 4):
+        print(f"usage: {sys.argv[0]} <run directory> <pod> [<step>]")
+        sys.exit(2)
+    log_dir, pod = sys.argv[1:3]
+    try:
+        if len(sys.argv) == 4:
+            sys.stdout.buffer.write(read_step(log_dir, pod, sys.argv[3]))
+            return
+        rows = read_index(log_dir, pod)
+    except (OSError, ValueError) as e:
+        print(f"can't read pane log: {e}")
+        sys.exit(1)
+    if not rows:
+        print(f"no pane log of {pod} in {log_dir}")
+        sys.exit(1)
+    for row in rows:
+        if row['command']:
+            started = time.strftime('%H:%M:%S', time.localtime(float(row['time'])))
+            print(f"step {row['step']:>3} {started} {row['command']}")
+
+
+if __name__ == '__main__':
+    main()
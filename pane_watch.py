@@ -0,0 +1,139 @@
+""" this module watches pod pane output streams, so fsm wakes only on output """
+
+import itertools
+import os
+import re
+import resource
+import shlex
+import shutil
+import selectors
+import tempfile
+
+READ_CHUNK = 65536
+# echoed after each waited step, typed command line shows $? so only real output matches
+EXIT_TAG = 'tmux_k8s_exit'
+EXIT_PATTERN = re.compile(EXIT_TAG.encode() + rb'=(\d+)')
+# tail of previous read kept, so exit tag split between reads is still found
+TAIL_BYTES = 32
+# shells that keep exit code of last command in $status, not in $?
+STATUS_SHELLS = ('fish',)
+
+
+def exit_echo(shell, stderr=False):
+    """ keys appended to waited command, so pane shell echoes exit code once it is done """
+    status = '$status' if os.path.basename(shell) in STATUS_SHELLS else '$?'
+    return f"; echo {EXIT_TAG}={status}" + (" >&2" if stderr else "")
+
+
+class PaneWatcher:
+    """ pipe-pane output of each pod pane into a fifo and wait on all of them at once,
+        everything read is also written to pane log, if there is one """
+
+    def __init__(self, log=None):
+        # one fifo per pod, hundreds of pods easily pass default soft limit
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        if soft != hard:
+            try:
+                resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+            except (ValueError, OSError):
+                pass
+        self.fifo_dir = tempfile.mkdtemp(prefix='tmux_k8s-')
+        self.selector = selectors.DefaultSelector()
+        self.fds = {}
+        self.paths = {}
+        self.settled = {}
+        self.exit_codes = {}
+        self.tails = {}
+        self.counter = itertools.count()
+        self.log = log
+
+    def watch(self, pod):
+        """ open fifo for pod, returns pipe-pane command that streams pane output into it """
+        path = os.path.join(self.fifo_dir, f'{next(self.counter)}.fifo')
+        os.mkfifo(path, 0o600)
+        # opened read-write, so fifo never reports EOF when pipe-pane writer goes away
+        fd = os.open(path, os.O_RDWR | os.O_NONBLOCK)
+        self.selector.register(fd, selectors.EVENT_READ, pod)
+        self.fds[pod] = fd
+        self.paths[pod] = path
+        self.settled[pod] = False
+        return f'cat > {shlex.quote(path)}'
+
+    def unwatch(self, pod):
+        """ close and remove fifo of pod that is gone, pod whose pane vanished before
+            it was watched has none """
+        fd = self.fds.pop(pod, None)
+        if fd is not None:
+            self._log(pod, self._read(fd))
+            self.selector.unregister(fd)
+            os.close(fd)
+            os.unlink(self.paths.pop(pod))
+        self.settled.pop(pod, None)
+        self.exit_codes.pop(pod, None)
+        self.tails.pop(pod, None)
+
+    def wake_on(self, fd):
+        """ wait() also returns when fd becomes readable, its data is discarded """
+        self.selector.register(fd, selectors.EVENT_READ, None)
+
+    def _read(self, fd):
+        """ drain fifo, return data read so far """
+        data = b''
+        while True:
+            try:
+                chunk = os.read(fd, READ_CHUNK)
+            except BlockingIOError:
+                return data
+            if not chunk:
+                return data
+            data += chunk
+
+    def _log(self, pod, data):
+        """ pass output of pod to pane log """
+        if self.log is not None:
+            self.log.write(pod, data)
+
+    def arm(self, pod):
+        """ forget output seen so far, called right before keys are sent to pod """
+        self._log(pod, self._read(self.fds[pod]))
+        self.settled[pod] = False
+        self.exit_codes.pop(pod, None)
+        self.tails[pod] = b''
+
+    def is_settled(self, pod):
+        """ new line was printed on pod since arm, so prompt on screen is a fresh one """
+        return self.settled[pod]
+
+    def exit_code(self, pod):
+        """ exit code of step echoed since arm, None if it was not seen """
+        return self.exit_codes.get(pod)
+
+    def wait(self, timeout):
+        """ block until some pane prints something, return set of pods with output """
+        active = set()
+        for key, _ in self.selector.select(timeout):
+            data = self._read(key.fd)
+            if key.data is None:
+                continue
+            if data:
+                pod = key.data
+                self._log(pod, data)
+                active.add(pod)
+                if b'\n' in data:
+                    self.settled[pod] = True
+                data = self.tails.get(pod, b'') + data
+                for match in EXIT_PATTERN.finditer(data):
+                    self.exit_codes[pod] = int(match.group(1))
+                self.tails[pod] = data[-TAIL_BYTES:]
+        return active
+
+    def close(self):
+        """ release fifos, pipe-pane writers die on next write """
+        for pod, fd in self.fds.items():
+            self._log(pod, self._read(fd))
+            self.selector.unregister(fd)
+            os.close(fd)
+        self.fds = {}
+        self.paths = {}
+        self.selector.close()
+        shutil.rmtree(self.fifo_dir, ignore_errors=True)
@@ -1,25 +1,82 @@
-""" this module converts from pod name to container name """
+""" this module converts from pod name to container name, using rules from pod2container.yaml """
 
+import functools
+import os
 import re
 
+RULES_FILE = os.environ.get(
+    'TMUX_K8S_P2C_RULES', os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                       'pod2container.yaml'))
+CACHE_SIZE = 4096
+# global inline flags of rule, like (?i), allowed only at start of whole combined regex
+GLOBAL_FLAGS = re.compile(r'^\(\?([aiLmsux]+)\)')
 
+
+class RuleError(Exception):
+    """ pod2container rules file is malformed """
+
+
+class RuleTable:
+    """ ordered pod name rules compiled into one regex, first matching rule wins """
+
+    def __init__(self, name, rules):
+        self.results = []
+        alternatives = []
+        for index, rule in enumerate(rules):
+            if not isinstance(rule, dict) or 'match' not in rule or \
+                    ('container' in rule) == ('segments' in rule):
+                raise RuleError(f"{name} rule {index} needs match and one of container, segments")
+            try:
+                re.compile(rule['match'])
+            except re.error as e:
+                raise RuleError(f"{name} rule {index} bad match {rule['match']}: {e}") from e
+            # global flags of rule apply only to that rule
+            pattern = GLOBAL_FLAGS.sub(r'(?\1:', rule['match'])
+            if pattern != rule['match']:
+                pattern += ')'
+            # rule is searched, like re.search on its own would do, ^ in it still anchors at start
+            alternatives.append(f'.*?(?:{pattern})(?P<r{index}>)')
+            self.results.append((rule.get('container'), rule.get('segments')))
+        try:
+            self.regex = re.compile('|'.join(alternatives), re.DOTALL) if alternatives else None
+        except re.error as e:
+            raise RuleError(f"{name} rules can't be combined into one regex: {e}") from e
+
+    def lookup(self, pod_name):
+        """ container for pod name, pod name itself if no rule matches """
+        if self.regex is None:
+            return pod_name
+        match = self.regex.match(pod_name)
+        if match is None:
+            return pod_name
+        container, segments = self.results[int(match.lastgroup[1:])]
+        if container is not None:
+            return container
+        return '-'.join(pod_name.split('-')[:segments])
+
+
+@functools.lru_cache(maxsize=None)
+def load_rules(path=RULES_FILE):
+    """ read and compile rules file once, returns (container, log container) tables """
+    import yaml  # pylint: disable=import-outside-toplevel
+    try:
+        with open(path, encoding='utf-8') as f:
+            rules = yaml.safe_load(f) or {}
+    except (OSError, yaml.YAMLError) as e:
+        raise RuleError(f"can't read {path}: {e}") from e
+    if not isinstance(rules, dict):
+        raise RuleError(f"{path} should map container and log_container to list of rules")
+    return (RuleTable('container', rules.get('container') or []),
+            RuleTable('log_container', rules.get('log_container') or []))
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
 def pod2container(base_pod_name):
     """pod to container used for exec"""
-    if re.search(r'^consumer', base_pod_name):
-        return base_pod_name.split("-")[0]
-    if re.search(r'^producer', base_pod_name):
-        return '-'.join(base_pod_name.split("-")[:2])
-    if re.search(r'^specific-pod-name', base_pod_name):
-        return 'specific-container-name'
-    if re.search(r'^nginx-sample', base_pod_name):
-        return 'nginx'
-    if re.search(r'^busybox1', base_pod_name):
-        return 'busybox'
-    return base_pod_name
+    return load_rules()[0].lookup(base_pod_name)
 
 
+@functools.lru_cache(maxsize=CACHE_SIZE)
 def pod2container_log(base_pod_name):
     """pod to container used for logs"""
-    if re.search(r'^busybox1', base_pod_name):
-        return 'logs'
-    return base_pod_name
+    return load_rules()[1].lookup(base_pod_name)
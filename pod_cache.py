@@ -0,0 +1,49 @@
+""" this module keeps listed pod names on disk, so repeated runs need not list them again """
+
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+CACHE_DIR = os.environ.get(
+    'TMUX_K8S_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'tmux_k8s'))
+# seconds cached list is used as is, older one is revalidated against api server
+CACHE_TTL = int(os.environ.get('TMUX_K8S_CACHE_TTL', '30'))
+
+
+def cache_file(key):
+    """ file of (context, namespace, label selector, field selector) key """
+    digest = hashlib.sha1(json.dumps(key).encode('utf-8')).hexdigest()
+    return os.path.join(CACHE_DIR, f'pods-{digest}.json')
+
+
+def load(key):
+    """ cached entry of key, None if there is none or it is unreadable """
+    try:
+        with open(cache_file(key), encoding='utf-8') as f:
+            entry = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(entry, dict) or entry.get('key') != list(key):
+        return None
+    return entry
+
+
+def store(key, resource_version, names):
+    """ write entry of key atomically, failing cache is not fatal """
+    entry = {'key': list(key), 'time': time.time(),
+             'resource_version': resource_version, 'names': names}
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        fd, path = tempfile.mkstemp(dir=CACHE_DIR, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(entry, f)
+        os.replace(path, cache_file(key))
+    except OSError as e:
+        print(f"can't write pod cache {CACHE_DIR}: {e}")
+
+
+def fresh(entry, ttl=CACHE_TTL):
+    """ entry is younger than ttl, so it is used without asking api server """
+    return time.time() - entry['time'] < ttl
@@ -0,0 +1,238 @@
+""" this module finds pods on many contexts and namespaces at once """
+
+import collections
+import fnmatch
+import functools
+import json
+import queue
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from kubernetes import client, config
+from kubernetes.client.rest import ApiException
+from kubernetes.config.config_exception import ConfigException
+from urllib3.exceptions import HTTPError
+
+import pod_cache
+
+DISCOVERY_WORKERS = 16
+PAGE_SIZE = 500
+# metadata only listing, older api server falls back to full pod list,
+# both have items[].metadata.name
+METADATA_ACCEPT = ('application/json;as=PartialObjectMetadataList;g=meta.k8s.io;v=v1,' +
+                   'application/json')
+# server side timeout of watch that brings cached pod list up to date
+REVALIDATE_SECONDS = 1
+# watch always lasts its timeout, smaller cached lists are listed again, metadata only
+# listing of them takes less than that
+REVALIDATE_MIN_PODS = 10 * PAGE_SIZE
+# (context, namespace, label selector, field selector) -> resource version of its pod list,
+# filled while listing, watch of pod changes continues from it
+LISTED_VERSIONS = {}
+# same key -> (contexts, namespaces) counts window labels of its pods were made with,
+# kept for every resolved key, listed or not, so pods joining later get same labels
+LISTED_LABELS = {}
+GLOB_CHARS = '*?['
+# cluster that can't be reached is reported and skipped, rest of clusters are used
+DISCOVERY_ERRORS = (ApiException, ConfigException, HTTPError, OSError)
+
+
+class Pod(collections.namedtuple('Pod', 'context namespace name label')):
+    """ pod on its context and namespace, label is short unique name used for windows """
+    __slots__ = ()
+
+    def __str__(self):
+        return self.label
+
+    def template_values(self):
+        """ values of pod placeholders used in sequence steps """
+        return {'pod': self.name, 'k8s_context': self.context, 'k8s_namespace': self.namespace}
+
+
+def is_glob(pattern):
+    """ pattern has shell style wildcards """
+    return any(char in pattern for char in GLOB_CHARS)
+
+
+def match_names(patterns, names):
+    """ names matching any of patterns, in patterns order, without duplicates """
+    matched = []
+    for pattern in patterns:
+        for name in names:
+            if fnmatch.fnmatchcase(name, pattern) and name not in matched:
+                matched.append(name)
+    return matched
+
+
+@functools.lru_cache(maxsize=None)
+def api_client(context):
+    """ one api client, ie connection pool, per context, global default config is not touched """
+    return config.new_client_from_config(context=context)
+
+
+def resolve_contexts(patterns):
+    """ contexts matching patterns, kube config is read only if some pattern is a glob """
+    if not any(is_glob(pattern) for pattern in patterns):
+        return list(dict.fromkeys(patterns))
+    contexts, _ = config.list_kube_config_contexts()
+    return match_names(patterns, [context['name'] for context in contexts])
+
+
+def resolve_namespaces(context, patterns):
+    """ namespaces of context matching patterns, cluster is asked only if some pattern is a glob """
+    if not any(is_glob(pattern) for pattern in patterns):
+        return list(dict.fromkeys(patterns))
+    v1 = client.CoreV1Api(api_client(context))
+    return match_names(patterns, [item.metadata.name for item in v1.list_namespace().items])
+
+
+def iter_pod_pages(context, namespace, label_selector, field_selector, page_size=PAGE_SIZE):
+    """ fetch pod names page by page, raw json is parsed without building pod models,
+        yields list of names and resource version of listing per page """
+    v1 = client.CoreV1Api(api_client(context))
+    token = None
+    while True:
+        response = v1.list_namespaced_pod(
+            namespace=namespace, label_selector=label_selector, field_selector=field_selector,
+            limit=page_size, _continue=token, _preload_content=False,
+            _headers={'Accept': METADATA_ACCEPT})
+        page = json.loads(response.data)
+        metadata = page.get('metadata') or {}
+        yield ([item['metadata']['name'] for item in page.get('items') or []],
+               metadata.get('resourceVersion'))
+        token = metadata.get('continue')
+        if not token:
+            return
+
+
+def watch_changes(context, namespace, label_selector, field_selector, resource_version):
+    """ pod events since resource version as (type, name, resource version) list,
+        None if resource version is too old to watch from """
+    v1 = client.CoreV1Api(api_client(context))
+    response = v1.list_namespaced_pod(
+        namespace=namespace, label_selector=label_selector, field_selector=field_selector,
+        watch=True, resource_version=resource_version, timeout_seconds=REVALIDATE_SECONDS,
+        _preload_content=False)
+    events = []
+    for line in response.data.splitlines():
+        if not line.strip():
+            continue
+        event = json.loads(line)
+        if event['type'] == 'ERROR':
+            return None
+        metadata = event['object']['metadata']
+        events.append((event['type'], metadata.get('name'), metadata['resourceVersion']))
+    return events
+
+
+def revalidated_names(key):
+    """ cached pod names of key, large list is brought up to date by watch once it is older
+        than ttl, None if there is nothing usable in cache and pods are to be listed """
+    entry = pod_cache.load(key)
+    if entry is None or not entry.get('resource_version'):
+        return None
+    if pod_cache.fresh(entry):
+        print(f"context {key[0]} namespace {key[1]}: pod list from cache")
+        LISTED_VERSIONS[key] = entry['resource_version']
+        return entry['names']
+    if len(entry['names']) < REVALIDATE_MIN_PODS:
+        return None
+    events = watch_changes(*key, entry['resource_version'])
+    if events is None:
+        return None
+    names = dict.fromkeys(entry['names'])
+    resource_version = entry['resource_version']
+    for kind, name, resource_version in events:
+        if kind == 'ADDED':
+            names[name] = None
+        elif kind == 'DELETED':
+            names.pop(name, None)
+    names = sorted(names)
+    pod_cache.store(key, resource_version, names)
+    LISTED_VERSIONS[key] = resource_version
+    print(f"context {key[0]} namespace {key[1]}: pod list from cache, " +
+          f"revalidated with {len(events)} events")
+    return names
+
+
+def _list_into(pages, key, refresh):
+    """ worker, put pages of pod names of (context, namespace, selectors) key into queue,
+        None once listing is over, whole listing is cached """
+    try:
+        names = None if refresh else revalidated_names(key)
+        if names is not None:
+            pages.put(names)
+            return
+        names = []
+        resource_version = None
+        for page, resource_version in iter_pod_pages(*key):
+            pages.put(page)
+            names += page
+        pod_cache.store(key, resource_version, names)
+        LISTED_VERSIONS[key] = resource_version
+    except DISCOVERY_ERRORS as e:
+        print(f"context {key[0]} namespace {key[1]}: can't list pods: {e}")
+    finally:
+        pages.put(None)
+
+
+def _resolve_into(pool, context, namespace_patterns, selectors, refresh):
+    """ worker, resolve namespaces of context and start listing each of them,
+        returns (namespace, queue of pages) list """
+    listings = []
+    for namespace in resolve_namespaces(context, namespace_patterns):
+        pages = queue.SimpleQueue()
+        pool.submit(_list_into, pages, (context, namespace, *selectors), refresh)
+        listings.append((namespace, pages))
+    return listings
+
+
+def pod_label(context, namespace, name, contexts, namespaces):
+    """ window label of pod, as short as stays unique within run """
+    if contexts > 1:
+        return f"{context}/{namespace}/{name}"
+    if namespaces > 1:
+        return f"{namespace}/{name}"
+    return name
+
+
+def discover_pod_pages(context_patterns, namespace_patterns, label_selector, field_selector,
+                       refresh=False):
+    """ list pods of all matching contexts and namespaces concurrently, so it takes
+        as long as slowest cluster, yields pages of pods grouped per context as they arrive,
+        cached pod lists are used unless refresh is set """
+    start = time.monotonic()
+    try:
+        contexts = resolve_contexts(context_patterns)
+    except DISCOVERY_ERRORS as e:
+        print(f"can't read contexts from kube config: {e}")
+        return
+    with ThreadPoolExecutor(max_workers=DISCOVERY_WORKERS) as pool:
+        resolving = [(context, pool.submit(_resolve_into, pool, context, namespace_patterns,
+                                           (label_selector, field_selector), refresh))
+                     for context in contexts]
+        for context, future in resolving:
+            try:
+                listings = future.result()
+            except DISCOVERY_ERRORS as e:
+                print(f"context {context}: can't list namespaces: {e}")
+                continue
+            for namespace, pages in listings:
+                LISTED_LABELS[(context, namespace, label_selector, field_selector)] = (
+                    len(contexts), len(listings))
+                count = 0
+                for names in iter(pages.get, None):
+                    count += len(names)
+                    yield [Pod(context, namespace, name,
+                               pod_label(context, namespace, name, len(contexts), len(listings)))
+                           for name in names]
+                print(f"context {context} namespace {namespace}: {count} pods")
+    print(f"--- discovery of {len(contexts)} contexts took {time.monotonic() - start:.1f}s")
+
+
+def discover_pods(context_patterns, namespace_patterns, label_selector, field_selector,
+                  refresh=False):
+    """ list of all pods of all matching contexts and namespaces """
+    return [pod for page in discover_pod_pages(
+        context_patterns, namespace_patterns, label_selector, field_selector, refresh)
+            for pod in page]
@@ -0,0 +1,127 @@
+""" this module watches pods while sequence runs, so pods that start or stop running are noticed """
+
+import os
+import queue
+import threading
+import time
+
+from kubernetes import client, watch
+from kubernetes.client.rest import ApiException
+
+import pod_cache
+from pod_discovery import Pod, api_client, iter_pod_pages, pod_label, DISCOVERY_ERRORS
+
+# server side timeout of one watch request, cache is updated after each
+WATCH_SECONDS = 60
+RETRY_SECONDS = 5
+HTTP_GONE = 410
+POD_ADDED = 'added'
+POD_GONE = 'gone'
+
+
+class PodMembership:
+    """ one watch thread per listed (context, namespace, selectors) key,
+        pods that start or stop running are queued and wake up fsm through a pipe """
+
+    def __init__(self, versions, labels, pods_list, names=None):
+        self.changes = queue.SimpleQueue()
+        self.stopped = False
+        # only pods of these names are followed, all if None
+        self.names = names
+        self.wake_read, self.wake_write = os.pipe()
+        os.set_blocking(self.wake_read, False)
+        os.set_blocking(self.wake_write, False)
+        # label counts of discovery, failed listings count too, so labels match listed pods
+        self.labels = labels
+        for key, resource_version in versions.items():
+            known = {pod.name for pod in pods_list if (pod.context, pod.namespace) == key[:2]}
+            threading.Thread(target=self._watch, args=(key, resource_version, known),
+                             daemon=True).start()
+
+    def fileno(self):
+        """ readable once some change is queued """
+        return self.wake_read
+
+    def _put(self, change, key, name):
+        """ queue change of pod and wake up fsm """
+        if self.names is not None and name not in self.names:
+            return
+        pod = Pod(key[0], key[1], name, pod_label(key[0], key[1], name, *self.labels[key]))
+        self.changes.put((change, pod))
+        try:
+            os.write(self.wake_write, b'.')
+        except BlockingIOError:
+            pass
+
+    def _resync(self, key, known):
+        """ watch expired, list pods again and queue difference, returns new resource version """
+        names = set()
+        resource_version = None
+        for page, resource_version in iter_pod_pages(*key):
+            names.update(page)
+        for name in names - known:
+            self._put(POD_ADDED, key, name)
+        for name in known - names:
+            self._put(POD_GONE, key, name)
+        known.clear()
+        known.update(names)
+        return resource_version
+
+    def _watch(self, key, resource_version, known):
+        """ thread, follow pod events of key until stopped """
+        context, namespace, label_selector, field_selector = key
+        v1 = client.CoreV1Api(api_client(context))
+        while not self.stopped:
+            stream = watch.Watch()
+            try:
+                if resource_version is None:
+                    resource_version = self._resync(key, known)
+                for event in stream.stream(
+                        v1.list_namespaced_pod, namespace, label_selector=label_selector,
+                        field_selector=field_selector, resource_version=resource_version,
+                        timeout_seconds=WATCH_SECONDS):
+                    if self.stopped:
+                        return
+                    metadata = event['raw_object']['metadata']
+                    name = metadata['name']
+                    resource_version = metadata['resourceVersion']
+                    if event['type'] == 'ADDED' and name not in known:
+                        known.add(name)
+                        self._put(POD_ADDED, key, name)
+                    elif name in known and (event['type'] == 'DELETED' or
+                                            metadata.get('deletionTimestamp')):
+                        known.discard(name)
+                        self._put(POD_GONE, key, name)
+                pod_cache.store(key, resource_version, sorted(known))
+            except ApiException as e:
+                if e.status != HTTP_GONE:
+                    print(f"context {context} namespace {namespace}: watch failed: {e.reason}")
+                    time.sleep(RETRY_SECONDS)
+                resource_version = None
+            except DISCOVERY_ERRORS as e:
+                print(f"context {context} namespace {namespace}: watch failed: {e}")
+                time.sleep(RETRY_SECONDS)
+
+    def pending(self):
+        """ pods that started and pods that stopped running since last call,
+            pod that came and went in between is left out of both """
+        try:
+            while os.read(self.wake_read, 4096):
+                pass
+        except BlockingIOError:
+            pass
+        added = []
+        gone = []
+        while not self.changes.empty():
+            change, pod = self.changes.get()
+            if change == POD_ADDED:
+                added.append(pod)
+            elif pod in added:
+                added.remove(pod)
+            else:
+                gone.append(pod)
+        return added, gone
+
+    def stop(self):
+        """ threads end with their current watch request """
+        self.stopped = True
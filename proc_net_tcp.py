@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+""" this module parses /proc/net/tcp and /proc/net/tcp6 of many pods into one connection table,
+    used as procTcp post process and to summarize procTcp run directory """
+
+import collections
+import functools
+import gzip
+import os
+import re
+import socket
+import sys
+
+TCP_STATES = {
+    0x01: 'ESTABLISHED', 0x02: 'SYN_SENT', 0x03: 'SYN_RECV', 0x04: 'FIN_WAIT1',
+    0x05: 'FIN_WAIT2', 0x06: 'TIME_WAIT', 0x07: 'CLOSE', 0x08: 'CLOSE_WAIT',
+    0x09: 'LAST_ACK', 0x0A: 'LISTEN', 0x0B: 'CLOSING', 0x0C: 'NEW_SYN_RECV',
+}
+# sl local rem st tx_queue:rx_queue, rest of line is not needed,
+# header lines of tcp and tcp6 do not match
+ENTRY = re.compile(rb'^\s*\d+:\s+([0-9A-Fa-f]+):([0-9A-Fa-f]{4})\s+([0-9A-Fa-f]+):([0-9A-Fa-f]{4})'
+                   rb'\s+([0-9A-Fa-f]{2})\s+([0-9A-Fa-f]{8}):([0-9A-Fa-f]{8})', re.MULTILINE)
+ARTIFACT_SUFFIX = '.procTcp.gz'
+TOP_ENDPOINTS = 20
+NETSTAT_HEADER = f"{'Proto':<6}{'Recv-Q':>7}{'Send-Q':>7} {'Local Address':<46}" + \
+                 f"{'Foreign Address':<46}State"
+
+Connection = collections.namedtuple(
+    'Connection', 'pod proto local local_port remote remote_port state tx_queue rx_queue')
+
+
+@functools.lru_cache(maxsize=65536)
+def decode_address(text):
+    """ kernel hex address, 32 bit words in host (little endian) order, to ip string """
+    raw = bytes.fromhex(text.decode('ascii'))
+    raw = b''.join(raw[word:word + 4][::-1] for word in range(0, len(raw), 4))
+    return socket.inet_ntop(socket.AF_INET if len(raw) == 4 else socket.AF_INET6, raw)
+
+
+def parse(text, pod=''):
+    """ connections of pod from /proc/net/tcp and/or tcp6 bytes, one regex pass over all of it """
+    return [Connection(pod, 'tcp' if len(local) == 8 else 'tcp6',
+                       decode_address(local), int(local_port, 16),
+                       decode_address(remote), int(remote_port, 16),
+                       TCP_STATES.get(int(state, 16), state.decode('ascii')),
+                       int(tx_queue, 16), int(rx_queue, 16))
+            for local, local_port, remote, remote_port, state, tx_queue, rx_queue
+            in ENTRY.findall(text)]
+
+
+def parse_many(texts):
+    """ one table of connections of all pods, texts is pod -> bytes mapping """
+    connections = []
+    for pod, text in texts.items():
+        connections += parse(text, pod)
+    return connections
+
+
+def count_by(connections, *fields):
+    """ number of connections per value of given fields, like ('pod', 'state') """
+    return collections.Counter(tuple(getattr(connection, field) for field in fields)
+                               for connection in connections)
+
+
+def endpoint(address, port):
+    """ address:port, ipv6 address in brackets """
+    return f"[{address}]:{port}" if ':' in address else f"{address}:{port}"
+
+
+def netstat_lines(connections):
+    """ connections in netstat -tn format """
+    yield NETSTAT_HEADER
+    for connection in connections:
+        yield (f"{connection.proto:<6}{connection.rx_queue:>7}{connection.tx_queue:>7} " +
+               f"{endpoint(connection.local, connection.local_port):<46}" +
+               f"{endpoint(connection.remote, connection.remote_port):<46}{connection.state}")
+
+
+def netstat(text):
+    """ procTcp post process, /proc/net/tcp bytes to netstat format text """
+    return ''.join(line + '\n' for line in netstat_lines(parse(text)))
+
+
+def read_artifacts(paths):
+    """ pod -> bytes of procTcp artifacts, directories are searched for them """
+    texts = {}
+    for path in paths:
+        if os.path.isdir(path):
+            files = [os.path.join(path, name) for name in sorted(os.listdir(path))
+                     if name.endswith(ARTIFACT_SUFFIX)]
+        else:
+            files = [path]
+        for name in files:
+            opener = gzip.open if name.endswith('.gz') else open
+            with opener(name, 'rb') as f:
+                texts[os.path.basename(name).split(ARTIFACT_SUFFIX)[0]] = f.read()
+    return texts
+
+
+def summary_lines(connections):
+    """ per pod connection counts by state, then most used remote endpoints over all pods """
+    states = [state for state in TCP_STATES.values()
+              if any(connection.state == state for connection in connections)]
+    pods = sorted({connection.pod for connection in connections})
+    width = max([len(pod) for pod in pods] + [3])
+    per_state = count_by(connections, 'pod', 'state')
+    lines = [f"{'pod':<{width}} {'total':>6} " + ' '.join(f"{state:>11}" for state in states)]
+    totals = count_by(connections, 'pod')
+    for pod in pods:
+        lines.append(f"{pod:<{width}} {totals[(pod,)]:>6} " +
+                     ' '.join(f"{per_state[(pod, state)]:>11}" for state in states))
+    remote = [connection for connection in connections
+              if connection.state not in ('LISTEN', 'CLOSE')]
+    per_endpoint = count_by(remote, 'remote', 'remote_port')
+    pods_per_endpoint = collections.Counter(
+        (address, port) for _, address, port in count_by(remote, 'pod', 'remote', 'remote_port'))
+    lines.append(f"top remote endpoints of {len(pods)} pods (connections, pods):")
+    for (address, port), count in per_endpoint.most_common(TOP_ENDPOINTS):
+        lines.append(f"  {count:>7} {pods_per_endpoint[(address, port)]:>5}  " +
+                     endpoint(address, port))
+    return lines
+
+
+def main():
+    """ without args read /proc/net/tcp text from stdin and print it in netstat format,
+        with summary and procTcp run directories or artifacts print merged summary """
+    if len(sys.argv) == 1:
+        sys.stdout.write(netstat(sys.stdin.buffer.read()))
+        return
+    if sys.argv[1] != 'summary' or len(sys.argv) < 3:
+        print(f"usage: {sys.argv[0]} < /proc/net/tcp")
+        print(f"       {sys.argv[0]} summary <procTcp run directory or artifact> ...")
+        sys.exit(2)
+    try:
+        texts = read_artifacts(sys.argv[2:])
+    except OSError as e:
+        print(f"can't read procTcp artifacts: {e}")
+        sys.exit(1)
+    for line in summary_lines(parse_many(texts)):
+        print(line)
+
+
+if __name__ == '__main__':
+    main()
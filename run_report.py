@@ -0,0 +1,108 @@
+""" this module records timing of each executed step and writes run report """
+
+import collections
+import csv
+import json
+import math
+import os
+import time
+
+# report files in run directory, .json, .csv and .txt
+REPORT_NAME = 'report'
+SLOWEST = 5
+FIELDS = ('pod', 'context', 'namespace', 'step', 'command', 'sent', 'seconds', 'polls', 'outcome',
+          'exit')
+OUTCOME_OK = 'ok'
+OUTCOME_FAILED = 'failed'
+OUTCOME_RETRY = 'retried'
+OUTCOME_NO_WAIT = 'no wait'
+OUTCOME_GONE = 'gone'
+OUTCOME_UNFINISHED = 'unfinished'
+
+
+def percentile(values, fraction):
+    """ nearest rank percentile of sorted values """
+    if not values:
+        return 0.0
+    return values[max(0, math.ceil(fraction * len(values)) - 1)]
+
+
+class RunReport:
+    """ per pod and per step send time, latency, prompt polls and outcome """
+
+    def __init__(self, name, run_dir):
+        self.name = name
+        self.run_dir = run_dir
+        self.started = time.time()
+        self.open = {}
+        self.records = []
+
+    def sent(self, pod, step, command):
+        """ keys of step were sent to pod """
+        self.open[pod] = {
+            'pod': str(pod), 'context': pod.context, 'namespace': pod.namespace,
+            'step': step, 'command': command, 'sent': round(time.time(), 3),
+            'seconds': None, 'polls': 0, 'outcome': None, 'exit': None,
+            'start': time.monotonic()}
+
+    def polled(self, pod):
+        """ pane of pod was captured to look for prompt """
+        if pod in self.open:
+            self.open[pod]['polls'] += 1
+
+    def done(self, pod, outcome, exit_code=None):
+        """ step running on pod is over """
+        record = self.open.pop(pod, None)
+        if record is None:
+            return
+        record['seconds'] = round(time.monotonic() - record.pop('start'), 3)
+        record['outcome'] = outcome
+        record['exit'] = exit_code
+        self.records.append(record)
+
+    def finish(self):
+        """ steps still running when fsm stops are recorded as unfinished """
+        for pod in list(self.open):
+            self.done(pod, OUTCOME_UNFINISHED)
+
+    def summary(self, control):
+        """ text lines with step latency percentiles, slowest steps and pods, tmux cost """
+        outcomes = collections.Counter(record['outcome'] for record in self.records)
+        waited = [record for record in self.records if record['outcome'] != OUTCOME_NO_WAIT]
+        latencies = sorted(record['seconds'] for record in waited)
+        lines = [f"run {self.name}: {len(self.records)} steps, " +
+                 ', '.join(f"{count} {outcome}" for outcome, count in outcomes.most_common()),
+                 f"step latency p50 {percentile(latencies, 0.5):.2f}s " +
+                 f"p95 {percentile(latencies, 0.95):.2f}s max {percentile(latencies, 1):.2f}s"]
+        steps = collections.defaultdict(list)
+        commands = {}
+        for record in waited:
+            steps[record['step']].append(record['seconds'])
+            # command differs per pod, part after kubectl exec tells what step does
+            commands.setdefault(record['step'], record['command'].split(' -- ')[-1])
+        lines.append("slowest steps (max, mean seconds):")
+        for step, seconds in sorted(steps.items(), key=lambda item: -max(item[1]))[:SLOWEST]:
+            lines.append(f"  {max(seconds):8.2f} {sum(seconds) / len(seconds):8.2f}  " +
+                         f"step {step}: {commands[step][:60]}")
+        pods = collections.Counter()
+        for record in waited:
+            pods[record['pod']] += record['seconds']
+        lines.append("slowest pods (total seconds):")
+        for pod, seconds in pods.most_common(SLOWEST):
+            lines.append(f"  {seconds:8.2f}  {pod}")
+        lines.append(f"tmux: {control.calls} commands in {control.round_trips} round trips")
+        return lines
+
+    def write(self, lines):
+        """ write json, csv and summary text files into run directory, returns path of summary """
+        base = os.path.join(self.run_dir, REPORT_NAME)
+        with open(base + '.json', 'w', encoding='utf-8') as f:
+            json.dump({'name': self.name, 'started': self.started, 'finished': time.time(),
+                       'summary': lines, 'steps': self.records}, f, indent=1)
+        with open(base + '.csv', 'w', encoding='utf-8', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=FIELDS)
+            writer.writeheader()
+            writer.writerows(self.records)
+        with open(base + '.txt', 'w', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+        return base + '.txt'
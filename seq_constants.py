@@ -8,3 +8,13 @@ FINAL_EXEC = NO_T_EXEC_OP + "exec : "
 DO_TERMINATE = NO_T_EXEC_OP + "terminate"
 DO_SLEEP = NO_T_EXEC_OP + "sleep : "
 REFRESH_PROMPT = NO_T_EXEC_OP + "refresh prompt "
+HEADLESS = NO_T_EXEC_OP + "headless"
+MAX_IN_FLIGHT = NO_T_EXEC_OP + "max in flight : "
+IN_FLIGHT = NO_T_EXEC_OP + "in flight : "
+WAVE = NO_T_EXEC_OP + "wave : "
+RETRY = NO_T_EXEC_OP + "retry : "
+STOP_ON_FAILURE = NO_T_EXEC_OP + "stop on failure"
+COLLECT = NO_T_EXEC_OP + "collect : "
+POST_PROCESS = NO_T_EXEC_OP + "post process : "
+# post process of python:module.function form is called in worker process, not as command
+POST_PROCESS_PYTHON = "python:"
@@ -0,0 +1,180 @@
+""" this module loads sequences from yaml files of system and user directories, translated
+    into sequence lines, validated and cached by file mtime, so listing hundreds stays instant """
+
+import json
+import os
+import tempfile
+
+from pod_cache import CACHE_DIR
+from seq_constants import COMMENT_TAG, NO_T_EXEC_OP, NO_RETURN, FINAL_EXEC, DO_ATTACH, DO_TERMINATE
+from seq_constants import DO_SLEEP, REFRESH_PROMPT, HEADLESS, MAX_IN_FLIGHT, WAVE
+from seq_constants import RETRY, STOP_ON_FAILURE, COLLECT, POST_PROCESS, IN_FLIGHT
+from seq_template import compile_sequence, TemplateError
+from sequences import KUBE_CTL_EXEC
+
+# later directory overrides sequence of same name from earlier one and from sequences.py
+SEQUENCE_DIRS = os.environ.get('TMUX_K8S_SEQUENCE_DIRS', os.pathsep.join([
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sequences.d'),
+    '/etc/tmux_k8s/sequences.d',
+    os.path.join(os.path.expanduser('~'), '.config', 'tmux_k8s', 'sequences.d'),
+])).split(os.pathsep)
+SUFFIXES = ('.yaml', '.yml')
+CACHE_FILE = os.path.join(CACHE_DIR, 'sequences.json')
+# bump when translation changes, so cached lines are translated again
+CACHE_VERSION = 2
+# sequence settings, key -> line prefix
+SETTINGS = {'max-in-flight': MAX_IN_FLIGHT, 'wave': WAVE}
+# step kinds, key -> line prefix, valueless ones take no value
+STEPS = {'exec': '', 'pod-exec': KUBE_CTL_EXEC, 'comment': COMMENT_TAG, 'sleep': DO_SLEEP,
+         'final-exec': FINAL_EXEC}
+VALUELESS_STEPS = {'refresh-prompt': REFRESH_PROMPT, 'no-return': NO_RETURN,
+                   'attach': DO_ATTACH, 'terminate': DO_TERMINATE}
+# modifiers of exec and pod-exec step
+MODIFIERS = {'retry': RETRY, 'collect': COLLECT, 'post-process': POST_PROCESS,
+             'in-flight': IN_FLIGHT}
+
+
+class SequenceFileError(Exception):
+    """ sequence file can't be read or translated """
+
+
+def command_line(kind, value):
+    """ exec, final exec or comment text as one sequence line """
+    if not isinstance(value, (str, int, float)) or isinstance(value, bool) or value == '':
+        raise SequenceFileError(f"{kind} needs text, got {value!r}")
+    value = str(value)
+    if '\n' in value:
+        raise SequenceFileError(f"{kind} should be one line, join commands with ; or &&: {value!r}")
+    if kind == 'exec' and value.startswith(NO_T_EXEC_OP):
+        raise SequenceFileError(f"{kind} can't start with {NO_T_EXEC_OP!r}: {value}")
+    return STEPS[kind] + value
+
+
+def step_lines(index, step):
+    """ sequence lines of one step, exec step is preceded by its modifiers """
+    if isinstance(step, str):
+        step = {'exec': step}
+    if not isinstance(step, dict):
+        raise SequenceFileError(f"step {index} should be command or mapping, got {step!r}")
+    kinds = [key for key in step if key in STEPS or key in VALUELESS_STEPS]
+    if len(kinds) != 1:
+        raise SequenceFileError(f"step {index} needs one of " +
+                                ', '.join(list(STEPS) + list(VALUELESS_STEPS)) +
+                                f", got {', '.join(map(str, step)) or 'nothing'}")
+    kind = kinds[0]
+    allowed = set(MODIFIERS) | {'stop-on-failure'} if kind in ('exec', 'pod-exec') else set()
+    extra = [key for key in step if key != kind and key not in allowed]
+    if extra:
+        raise SequenceFileError(f"step {index} {kind} can't have {', '.join(map(str, extra))}")
+    if kind in VALUELESS_STEPS:
+        return [VALUELESS_STEPS[kind]]
+    lines = [prefix + str(step[key]) for key, prefix in MODIFIERS.items() if key in step]
+    if step.get('stop-on-failure'):
+        lines.append(STOP_ON_FAILURE)
+    return lines + [command_line(kind, step[kind])]
+
+
+def translate(data):
+    """ parsed yaml of one sequence to sequence lines """
+    if not isinstance(data, dict):
+        raise SequenceFileError("should be mapping with description and steps")
+    unknown = set(data) - {'description', 'headless', 'steps'} - set(SETTINGS)
+    if unknown:
+        raise SequenceFileError(f"unknown keys {', '.join(sorted(map(str, unknown)))}")
+    if not isinstance(data.get('steps'), list) or not data['steps']:
+        raise SequenceFileError("needs list of steps")
+    lines = []
+    if data.get('description'):
+        lines.append(command_line('comment', data['description']))
+    if data.get('headless'):
+        lines.append(HEADLESS)
+    for key, prefix in SETTINGS.items():
+        if key in data:
+            lines.append(prefix + str(data[key]))
+    for index, step in enumerate(data['steps']):
+        lines += step_lines(index, step)
+    return lines
+
+
+def load_file(path, name):
+    """ read, translate and compile sequence file, returns its lines,
+        yaml is imported only when some file is not cached """
+    import yaml  # pylint: disable=import-outside-toplevel
+    try:
+        with open(path, encoding='utf-8') as f:
+            # libyaml based loader when pyyaml has it
+            data = yaml.load(f, Loader=getattr(yaml, 'CSafeLoader', yaml.SafeLoader))
+    except (OSError, yaml.YAMLError) as e:
+        raise SequenceFileError(f"can't read: {e}") from e
+    lines = translate(data)
+    try:
+        compile_sequence(name, lines)
+    except TemplateError as e:
+        raise SequenceFileError(str(e)) from e
+    return lines
+
+
+def read_cache():
+    """ path -> cached entry, empty if cache is missing, unreadable or of other version """
+    try:
+        with open(CACHE_FILE, encoding='utf-8') as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(cache, dict) or cache.get('version') != CACHE_VERSION:
+        return {}
+    return cache.get('files', {})
+
+
+def write_cache(files):
+    """ write cache atomically, failing cache is not fatal """
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        fd, path = tempfile.mkstemp(dir=CACHE_DIR, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump({'version': CACHE_VERSION, 'files': files}, f)
+        os.replace(path, CACHE_FILE)
+    except OSError as e:
+        print(f"can't write sequence cache {CACHE_DIR}: {e}")
+
+
+def sequence_files(dirs=None):
+    """ (path, sequence name, stat) of sequence files, directories in override order """
+    found = []
+    for directory in SEQUENCE_DIRS if dirs is None else dirs:
+        try:
+            entries = sorted(os.scandir(directory), key=lambda entry: entry.name)
+        except OSError:
+            continue
+        for entry in entries:
+            name, suffix = os.path.splitext(entry.name)
+            if suffix in SUFFIXES and entry.is_file():
+                found.append((os.path.abspath(entry.path), name, entry.stat()))
+    return found
+
+
+def load_sequences(builtin, dirs=None):
+    """ sequences.py ones merged with sequence files, returns (name -> lines, name -> file),
+        only files changed since cached are parsed, malformed ones are reported and left out """
+    cached = read_cache()
+    files = {}
+    merged = dict(builtin)
+    origins = {}
+    for path, name, stat in sequence_files(dirs):
+        entry = cached.get(path)
+        if entry is None or entry['mtime'] != stat.st_mtime_ns or entry['size'] != stat.st_size:
+            entry = {'mtime': stat.st_mtime_ns, 'size': stat.st_size, 'lines': None,
+                     'error': None}
+            try:
+                entry['lines'] = load_file(path, name)
+            except SequenceFileError as e:
+                entry['error'] = str(e)
+        files[path] = entry
+        if entry['error'] is not None:
+            print(f"sequence file {path} is malformed, skipped: {entry['error']}")
+            continue
+        merged[name] = entry['lines']
+        origins[name] = path
+    if files != cached:
+        write_cache(files)
+    return merged, origins
@@ -0,0 +1,284 @@
+""" this module compiles sequences into steps with templates rendered per pod without eval """
+
+import string
+
+from pod2container import pod2container as p2c
+from pod2container import pod2container_log as p2cLog
+
+from seq_constants import COMMENT_TAG, NO_RETURN, FINAL_EXEC
+from seq_constants import DO_ATTACH, DO_TERMINATE, NO_T_EXEC_OP
+from seq_constants import DO_SLEEP, REFRESH_PROMPT, HEADLESS
+from seq_constants import MAX_IN_FLIGHT, WAVE, RETRY, STOP_ON_FAILURE, COLLECT, POST_PROCESS
+from seq_constants import IN_FLIGHT, POST_PROCESS_PYTHON
+
+STEP_EXEC = 'exec'
+STEP_COMMENT = 'comment'
+STEP_REFRESH = 'refresh prompt'
+STEP_SLEEP = 'sleep'
+STEP_NO_RETURN = 'no return'
+STEP_NO_OP = 'no op'
+STEP_ATTACH = 'attach'
+STEP_TERMINATE = 'terminate'
+STEP_FINAL_EXEC = 'final exec'
+STEP_HEADLESS = 'headless'
+STEP_MAX_IN_FLIGHT = 'max in flight'
+STEP_WAVE = 'wave'
+STEP_RETRY = 'retry'
+STEP_STOP_ON_FAILURE = 'stop on failure'
+STEP_COLLECT = 'collect'
+STEP_POST_PROCESS = 'post process'
+STEP_IN_FLIGHT = 'in flight'
+# modifiers apply to exec step that follows them
+MODIFIER_STEPS = (STEP_RETRY, STEP_STOP_ON_FAILURE, STEP_COLLECT, STEP_POST_PROCESS,
+                  STEP_IN_FLIGHT)
+# artifact name becomes part of file name
+ARTIFACT_NAME_CHARS = frozenset(string.ascii_letters + string.digits + '-_.')
+# first retry waits this long, each next one twice as long
+RETRY_BACKOFF_SECONDS = 2
+# rolling starts new pod as soon as one finishes, batch waits for whole wave to finish
+WAVE_ROLLING = 'rolling'
+WAVE_BATCH = 'batch'
+# steps that need a live terminal, can't be part of headless sequence
+INTERACTIVE_STEPS = (STEP_REFRESH, STEP_NO_RETURN, STEP_ATTACH)
+
+# placeholders available to sequence steps, extend here with your own functions
+PLACEHOLDERS = {
+    'pod': lambda values: values['pod'],
+    'k8s_context': lambda values: values['k8s_context'],
+    'k8s_namespace': lambda values: values['k8s_namespace'],
+    'p2c(pod)': lambda values: p2c(values['pod']),
+    'p2cLog(pod)': lambda values: p2cLog(values['pod']),
+}
+# final exec runs once on local machine, there is no pod
+FINAL_EXEC_PLACEHOLDERS = ('k8s_context', 'k8s_namespace')
+
+
+class TemplateError(Exception):
+    """ sequence step can't be compiled """
+
+
+class Template:
+    """ step text split into literals and placeholders, once """
+
+    def __init__(self, text, allowed=tuple(PLACEHOLDERS)):
+        self.text = text
+        self.parts = []
+        try:
+            parsed = list(string.Formatter().parse(text))
+        except ValueError as e:
+            raise TemplateError(f"{e} in: {text}") from e
+        for literal, field, spec, conversion in parsed:
+            if literal:
+                self.parts.append((literal, None, ''))
+            if field is None:
+                continue
+            name = field.replace(' ', '')
+            if conversion or name not in allowed:
+                raise TemplateError(f"unknown placeholder {{{field}}} in: {text}")
+            self.parts.append(('', PLACEHOLDERS[name], spec))
+
+    def render(self, values):
+        """ render template with pod, k8s_context, k8s_namespace values """
+        return ''.join(literal if getter is None else format(getter(values), spec)
+                       for literal, getter, spec in self.parts)
+
+
+class Step:
+    """ one compiled sequence step """
+
+    def __init__(self, kind, text, template=None, value=0):
+        self.kind = kind
+        self.text = text
+        self.template = template
+        # seconds of sleep step, or setting value
+        self.value = value
+        # next step is no return or refresh prompt, so do not wait for prompt
+        self.no_wait = False
+        # set by preceding modifier steps
+        self.retries = 0
+        self.stop_on_failure = False
+        # stdout goes to artifact of this name, which is fed to post process command
+        self.collect = None
+        self.post_process = None
+        # max pods running this step at once, 0 is no limit, rest of sequence is not limited
+        self.in_flight = 0
+
+    def retry_delay(self, attempt):
+        """ seconds to wait before given retry attempt, counted from 1 """
+        return RETRY_BACKOFF_SECONDS * 2 ** (attempt - 1)
+
+
+class Sequence:
+    """ compiled sequence, list of steps """
+
+    def __init__(self, name, steps):
+        self.name = name
+        self.steps = steps
+
+    @property
+    def headless(self):
+        """ sequence is marked non interactive, it runs without tmux """
+        return any(step.kind == STEP_HEADLESS for step in self.steps)
+
+    def setting(self, kind, default):
+        """ value of last setting step of given kind """
+        values = [step.value for step in self.steps if step.kind == kind]
+        return values[-1] if values else default
+
+    @property
+    def max_in_flight(self):
+        """ max pods running sequence at once, 0 is no limit """
+        return self.setting(STEP_MAX_IN_FLIGHT, 0)
+
+    @property
+    def wave(self):
+        """ how pods are started when max in flight is set """
+        return self.setting(STEP_WAVE, WAVE_ROLLING)
+
+    @property
+    def collects(self):
+        """ some step streams its output into artifact """
+        return any(step.collect for step in self.steps)
+
+    @property
+    def final(self):
+        """ last step, tells what to do once all pods are done """
+        return self.steps[-1].kind if self.steps else STEP_NO_OP
+
+
+# steps with whole number value, 0 or more, (prefix, kind, what number means)
+NUMBER_STEPS = (
+    (DO_SLEEP, STEP_SLEEP, 'whole seconds'),
+    (MAX_IN_FLIGHT, STEP_MAX_IN_FLIGHT, 'number of pods'),
+    (RETRY, STEP_RETRY, 'number of retries'),
+    (IN_FLIGHT, STEP_IN_FLIGHT, 'number of pods'),
+)
+
+
+def compile_step(line):
+    """ classify sequence line and compile its template """
+    if line.startswith(COMMENT_TAG):
+        return Step(STEP_COMMENT, line)
+    if line.startswith(REFRESH_PROMPT):
+        return Step(STEP_REFRESH, line)
+    for prefix, kind, what in NUMBER_STEPS:
+        if line.startswith(prefix):
+            try:
+                value = int(line[len(prefix):])
+            except ValueError as e:
+                raise TemplateError(f"{kind} needs {what} in: {line}") from e
+            if value < 0:
+                raise TemplateError(f"{kind} needs {what}, not negative one, in: {line}")
+            return Step(kind, line, value=value)
+    if line == STOP_ON_FAILURE:
+        return Step(STEP_STOP_ON_FAILURE, line)
+    if line.startswith(COLLECT):
+        name = line[len(COLLECT):]
+        if not name or not set(name) <= ARTIFACT_NAME_CHARS:
+            raise TemplateError(f"collect needs artifact name of letters, digits, -_. in: {line}")
+        return Step(STEP_COLLECT, line, value=name)
+    if line.startswith(POST_PROCESS):
+        command = line[len(POST_PROCESS):].strip()
+        if not command:
+            raise TemplateError(f"post process needs local command in: {line}")
+        if command.startswith(POST_PROCESS_PYTHON) and \
+                not all(command[len(POST_PROCESS_PYTHON):].rpartition('.')[::2]):
+            raise TemplateError(f"post process needs {POST_PROCESS_PYTHON}module.function " +
+                                f"in: {line}")
+        return Step(STEP_POST_PROCESS, line, value=line[len(POST_PROCESS):])
+    if line.startswith(WAVE):
+        if line[len(WAVE):] not in (WAVE_ROLLING, WAVE_BATCH):
+            raise TemplateError(f"wave should be {WAVE_ROLLING} or {WAVE_BATCH} in: {line}")
+        return Step(STEP_WAVE, line, value=line[len(WAVE):])
+    if line.startswith(NO_RETURN):
+        return Step(STEP_NO_RETURN, line)
+    if line == HEADLESS:
+        return Step(STEP_HEADLESS, line)
+    if line == DO_ATTACH:
+        return Step(STEP_ATTACH, line)
+    if line.startswith(DO_TERMINATE):
+        return Step(STEP_TERMINATE, line)
+    if line.startswith(FINAL_EXEC):
+        return Step(STEP_FINAL_EXEC, line,
+                    Template(line[len(FINAL_EXEC):], FINAL_EXEC_PLACEHOLDERS))
+    if line.startswith(NO_T_EXEC_OP):
+        return Step(STEP_NO_OP, line)
+    return Step(STEP_EXEC, line, Template(line))
+
+
+def apply_modifiers(steps):
+    """ move retry, stop on failure, collect, post process and in flight modifiers onto
+        command step they precede """
+    modifiers = []
+    for step in steps:
+        if step.kind in MODIFIER_STEPS:
+            modifiers.append(step)
+            continue
+        if step.kind in (STEP_COMMENT, STEP_NO_OP) or not modifiers:
+            continue
+        if step.kind != STEP_EXEC:
+            raise TemplateError(f"{modifiers[0].text} should be followed by command, not: " +
+                                step.text)
+        if step.no_wait:
+            raise TemplateError("step without exit code can't be retried, stopped on, " +
+                                "collected or limited: " + step.text)
+        for modifier in modifiers:
+            if modifier.kind == STEP_RETRY:
+                step.retries = modifier.value
+            elif modifier.kind == STEP_COLLECT:
+                step.collect = modifier.value
+            elif modifier.kind == STEP_POST_PROCESS:
+                step.post_process = modifier.value
+            elif modifier.kind == STEP_IN_FLIGHT:
+                step.in_flight = modifier.value
+            else:
+                step.stop_on_failure = True
+        if step.post_process and not step.collect:
+            raise TemplateError(f"post process needs collect of same command: {step.text}")
+        modifiers = []
+    if modifiers:
+        raise TemplateError(f"{modifiers[0].text} should be followed by command")
+
+
+def exit_echo_error(text):
+    """ why exit code echo can't be appended to command waiting for prompt, None if it can,
+        trailing & ; | would make it syntax error and trailing comment would hide it """
+    quote = None
+    escaped = False
+    previous = ' '
+    for char in text:
+        if escaped:
+            escaped = False
+        elif char == '\\' and quote != "'":
+            escaped = True
+        elif quote:
+            quote = None if char == quote else quote
+        elif char in '\'"':
+            quote = char
+        elif char == '#' and previous in ' \t;&|(':
+            return "ends with comment"
+        previous = char
+    if text.rstrip().endswith(('&', ';', '|')):
+        return f"ends with {text.rstrip()[-1]}"
+    return None
+
+
+def compile_sequence(name, lines):
+    """ compile all lines of sequence, raises TemplateError on first malformed one """
+    steps = [compile_step(line) for line in lines]
+    for step, following in zip(steps, steps[1:]):
+        if step.kind == STEP_EXEC and following.kind in (STEP_NO_RETURN, STEP_REFRESH):
+            step.no_wait = True
+    apply_modifiers(steps)
+    sequence = Sequence(name, steps)
+    if sequence.headless:
+        for step in steps:
+            if step.kind in INTERACTIVE_STEPS:
+                raise TemplateError(f"headless sequence can't have interactive step: {step.text}")
+        return sequence
+    for step in steps:
+        error = step.kind == STEP_EXEC and not step.no_wait and exit_echo_error(step.text)
+        if error:
+            raise TemplateError(f"command waiting for prompt {error}, its exit code can't be " +
+                                f"echoed after it: {step.text}")
+    return sequence
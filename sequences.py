@@ -1,9 +1,9 @@
 """ this module defines set of available sequences for tmux_k8s """
 
-
 from seq_constants import COMMENT_TAG, NO_RETURN, FINAL_EXEC
 from seq_constants import DO_ATTACH, DO_TERMINATE, DO_SLEEP
-from seq_constants import REFRESH_PROMPT 
+from seq_constants import REFRESH_PROMPT, HEADLESS, IN_FLIGHT, RETRY, STOP_ON_FAILURE
+from seq_constants import COLLECT, POST_PROCESS, POST_PROCESS_PYTHON
 
 
 
@@ -11,6 +11,18 @@ KUBE_CTL = "kubectl --context {k8s_context} -n {k8s_namespace} "
 KUBE_CTL_EXEC = KUBE_CTL + " exec {pod} -c {p2c(pod)} -- "
 KUBE_CTL_EXEC_IT = KUBE_CTL + " exec -it {pod} -c {p2c(pod)} -- "
 
+# local parser of /proc/net/tcp, called in post process worker, no interpreter per pod
+PROC_NET_TCP = POST_PROCESS_PYTHON + 'proc_net_tcp.netstat'
+
+# do not hit package mirrors from every pod at once, limit covers apt step only,
+# so captures that follow it still run on all pods at the same time
+APT_IN_FLIGHT = IN_FLIGHT + "50"
+# mirrors fail now and then, without package there is no point in running rest of sequence
+APT_RETRY = RETRY + "2"
+# capture that ran for its whole time is done, not failed, timeout exits with 124 then,
+# $ is escaped here and in pid lookups of strace so it is expanded by pod bash, not by local shell
+TIMEOUT_OK = '; rc=\\$?; [ \\$rc -eq 124 ] && rc=0; exit \\$rc'
+
 # logs is just example, it is simpler to use single kubectl logs with label selector
 KUBE_CTL_LOGS_SWITCHES = " --prefix --timestamps --max-log-requests 100 "
 KUBE_CTL_LOGS1 = KUBE_CTL + "logs -f" + KUBE_CTL_LOGS_SWITCHES + "{pod} -c {p2c(pod)}"
@@ -18,110 +30,135 @@ KUBE_CTL_LOGS2 = KUBE_CTL + "logs -f" + KUBE_CTL_LOGS_SWITCHES + "{pod} -c {p2cL
 
 sequences = {
     'env': [
-        COMMENT_TAG + 'execute env on each pod and put to pod.env file',
-        KUBE_CTL_EXEC + 'env > {pod}.env'
+        COMMENT_TAG + 'execute env on each pod and collect it to pod.env.gz',
+        HEADLESS,
+        COLLECT + 'env',
+        KUBE_CTL_EXEC + 'env'
     ],
     'env-ac': [
-        COMMENT_TAG + 'execute env on each pod and put to pod.env file, auto close',
-        KUBE_CTL_EXEC + 'env > {pod}.env',
+        COMMENT_TAG + 'execute env on each pod and collect it to pod.env.gz, auto close',
+        HEADLESS,
+        COLLECT + 'env',
+        KUBE_CTL_EXEC + 'env',
         DO_TERMINATE
     ],
     'env-at': [
-        COMMENT_TAG + 'execute env on each pod and put to pod.env file, auto attach',
-        KUBE_CTL_EXEC + 'env > {pod}.env',
+        COMMENT_TAG + 'execute env on each pod and collect it to pod.env.gz, auto attach',
+        COLLECT + 'env',
+        KUBE_CTL_EXEC + 'env',
         DO_ATTACH
     ],
     'procTcp': [
-        COMMENT_TAG + 'get /proc/net/tcp on each then convert it to netstat format',
-        KUBE_CTL_EXEC + ' /bin/cat /proc/net/tcp  > {pod}.procTcp.raw',
-        'cat {pod}.procTcp.raw | ./proc_netstat.sh > {pod}.procTcp.parsed',
+        COMMENT_TAG + 'get /proc/net/tcp and tcp6 on each then convert it to netstat format',
+        HEADLESS,
+        COLLECT + 'procTcp',
+        POST_PROCESS + PROC_NET_TCP,
+        KUBE_CTL_EXEC + ' /bin/cat /proc/net/tcp /proc/net/tcp6',
         DO_TERMINATE
     ],
     'tcpdump-all': [
         COMMENT_TAG + 'tcpdump on any interface all traffic for 300 seconds or 100k packets',
+        APT_IN_FLIGHT,
+        APT_RETRY,
+        STOP_ON_FAILURE,
+        KUBE_CTL_EXEC + '/bin/bash -c "apt -y update && apt -y install tcpdump"',
+        COLLECT + 'pcap',
         KUBE_CTL_EXEC + '/bin/bash -c ' +
-        '"apt -y update && apt -y install tcpdump"',
-        KUBE_CTL_EXEC + '/bin/bash -c ' +
-        '"timeout 300 tcpdump -i any -w /tmp/{pod}.pcap -s65535 -c 100000"',
-        KUBE_CTL_EXEC + '/bin/bash -c ' +
-        '"rm -f /tmp/{pod}.pcap.gz && cd /tmp && gzip {pod}.pcap"',
-        KUBE_CTL + 'cp {pod}:/tmp/{pod}.pcap.gz -c {p2c(pod)} --retries=4 ./{pod}.pcap.gz',
+        '"timeout 300 tcpdump -i any -U -w - -s65535 -c 100000' + TIMEOUT_OK + '"',
         DO_TERMINATE
     ],
     'tcpdump-http-80': [
         COMMENT_TAG + 'install tcpdump and start tcpdump on all interfaces on port 80',
+        APT_IN_FLIGHT,
+        APT_RETRY,
+        STOP_ON_FAILURE,
         KUBE_CTL_EXEC + '/bin/bash -c "apt -y update && apt -y install tcpdump"',
+        COLLECT + 'pcap',
         KUBE_CTL_EXEC + '/bin/bash -c ' +
-        '"timeout 300 tcpdump -i any -w /tmp/{pod}.pcap -s65535 -c 100000 port 80"',
-        KUBE_CTL_EXEC + '/bin/bash -c ' +
-        '"rm -f /tmp/{pod}.pcap.gz && cd /tmp && gzip {pod}.pcap"',
-        KUBE_CTL + 'cp {pod}:/tmp/{pod}.pcap.gz -c {p2c(pod)} --retries=4 ./{pod}.pcap.gz',
+        '"timeout 300 tcpdump -i any -U -w - -s65535 -c 100000 port 80' + TIMEOUT_OK + '"',
         DO_TERMINATE
     ],
     'tcpdump-redis-6379': [
         COMMENT_TAG + 'install tcpdump and start tcpdump on all interfaces on port 6379',
+        APT_IN_FLIGHT,
+        APT_RETRY,
+        STOP_ON_FAILURE,
         KUBE_CTL_EXEC + '/bin/bash -c "apt -y update && apt -y install tcpdump"',
+        COLLECT + 'pcap',
         KUBE_CTL_EXEC + '/bin/bash -c ' +
-        '"timeout 300 tcpdump -i any -w /tmp/{pod}.pcap -s65535 -c 100000 port 6379"',
-        KUBE_CTL_EXEC + '/bin/bash -c ' +
-        '"rm -f /tmp/{pod}.pcap.gz && cd /tmp && gzip {pod}.pcap"',
-        KUBE_CTL + 'cp {pod}:/tmp/{pod}.pcap.gz -c {p2c(pod)} --retries=4 ./{pod}.pcap.gz',
+        '"timeout 300 tcpdump -i any -U -w - -s65535 -c 100000 port 6379' + TIMEOUT_OK + '"',
         DO_TERMINATE
     ],
     'tcpdump-memcache-11211': [
         COMMENT_TAG + 'install tcpdump and start tcpdump on all interfaces on port 11211',
-        KUBE_CTL_EXEC + '/bin/bash -c "apt -y update &&apt -y install tcpdump"',
+        APT_IN_FLIGHT,
+        APT_RETRY,
+        STOP_ON_FAILURE,
+        KUBE_CTL_EXEC + '/bin/bash -c "apt -y update && apt -y install tcpdump"',
+        COLLECT + 'pcap',
         KUBE_CTL_EXEC + '/bin/bash -c ' +
-        '"timeout 300 tcpdump -i any -w /tmp/{pod}.pcap -s65535 -c 100000 port 11211"',
-        KUBE_CTL_EXEC + '/bin/bash -c "rm -f /tmp/{pod}.pcap.gz && cd /tmp && gzip {pod}.pcap"',
-        KUBE_CTL + 'cp {pod}:/tmp/{pod}.pcap.gz -c {p2c(pod)} --retries=4 ./{pod}.pcap.gz',
+        '"timeout 300 tcpdump -i any -U -w - -s65535 -c 100000 port 11211' + TIMEOUT_OK + '"',
         DO_TERMINATE
     ],
     'strace-php': [
         COMMENT_TAG + 'install strace and start strace on all php processes',
+        APT_IN_FLIGHT,
+        APT_RETRY,
+        STOP_ON_FAILURE,
         KUBE_CTL_EXEC + '/bin/bash -c "apt -y update && apt -y install strace psmisc procps"',
+        COLLECT + 'strace',
         KUBE_CTL_EXEC + '/bin/bash -c ' +
-        '"timeout 300 strace -o /tmp/{pod}.strace -s999999 -yy -tt -T ' +
-        '$(pgrep php | awk \'{print " -p " $1 }\'"',
-        KUBE_CTL_EXEC + '/bin/bash -c ' +
-        '"rm -f /tmp/{pod}.strace.gz && cd /tmp && gzip {pod}.strace"',
-        KUBE_CTL + 'cp {pod}:/tmp/{pod}.strace.gz -c {p2c(pod)} --retries=4 ./{pod}.strace.gz',
+        '"timeout 300 strace -o /dev/stdout -s999999 -yy -tt -T ' +
+        '\\$(pgrep php | xargs -Ix echo -p x)' + TIMEOUT_OK + '"',
         DO_TERMINATE
     ],
     'strace-net-php': [
         COMMENT_TAG + 'install strace and start strace on all php processes,' +
         'record net system calls',
+        APT_IN_FLIGHT,
+        APT_RETRY,
+        STOP_ON_FAILURE,
         KUBE_CTL_EXEC + '/bin/bash -c "apt -y update && apt -y install strace psmisc procps"',
-        KUBE_CTL_EXEC + '/bin/bash -c "timeout 30' +
-        '/usr/bin/strace -o /tmp/{pod}.strace -s999999 -e trace=network -yy -tt -T ' +
-        '$(pgrep php | xargs -Ix echo -p x  )"',
-        KUBE_CTL_EXEC + '/bin/bash -c "rm -f /tmp/{pod}.strace.gz && cd /tmp && gzip {pod}.strace"',
-        KUBE_CTL + ' cp {pod}:/tmp/{pod}.strace.gz -c {p2c(pod)} --retries=4 ./{pod}.strace.gz',
+        COLLECT + 'strace',
+        KUBE_CTL_EXEC + '/bin/bash -c "timeout 30 ' +
+        '/usr/bin/strace -o /dev/stdout -s999999 -e trace=network -yy -tt -T ' +
+        '\\$(pgrep php | xargs -Ix echo -p x)' + TIMEOUT_OK + '"',
         DO_TERMINATE
     ],
     'pingKubeSvcHost': [
         COMMENT_TAG + 'install ping util and ping KUBERNETES_SERVICE_HOST env variable ip',
+        APT_IN_FLIGHT,
+        APT_RETRY,
+        STOP_ON_FAILURE,
         KUBE_CTL_EXEC + '/bin/bash -c "apt -y update && apt -y install iputils-ping"',
         KUBE_CTL_EXEC + '/bin/bash -c "ping -c 10 ' + '\\' + '$KUBERNETES_SERVICE_HOST"',
         DO_TERMINATE
     ],
     'tcpdumpInstall': [
         COMMENT_TAG + 'install tcpdump',
+        APT_IN_FLIGHT,
+        APT_RETRY,
         KUBE_CTL_EXEC + '/bin/bash -c "apt -y update && apt -y install tcpdump"',
         DO_TERMINATE
     ],
     'straceInstall': [
         COMMENT_TAG + 'install strace',
+        APT_IN_FLIGHT,
+        APT_RETRY,
         KUBE_CTL_EXEC + '/bin/bash -c "apt -y update && apt -y install strace"',
         DO_TERMINATE
     ],
     'pingInstall': [
         COMMENT_TAG + 'install ping',
+        APT_IN_FLIGHT,
+        APT_RETRY,
         KUBE_CTL_EXEC + '/bin/bash -c "apt -y update && apt -y install iputils-ping"',
         DO_TERMINATE
     ],
     'psInstall': [
         COMMENT_TAG + 'install ps and pgrep',
+        APT_IN_FLIGHT,
+        APT_RETRY,
         KUBE_CTL_EXEC + '/bin/bash -c "apt -y update && apt -y install psmisc procps"',
         DO_TERMINATE
     ],
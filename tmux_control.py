@@ -0,0 +1,116 @@
+""" this module talks to tmux over one persistent control mode (tmux -C) connection """
+
+import queue
+import subprocess
+import threading
+
+# %begin/%end flags, 1 marks blocks answering commands sent by this client
+FLAG_OWN_COMMAND = 1
+
+
+class ControlModeError(Exception):
+    """ control mode connection to tmux is closed """
+
+
+class ControlResult:
+    """ reply of one tmux command, shaped like libtmux tmux_cmd result """
+
+    def __init__(self, lines, failed):
+        while lines and lines[-1] == '':
+            lines.pop()
+        self.stdout = [] if failed else lines
+        self.stderr = lines if failed else []
+
+
+def quote(arg):
+    """ quote argument for tmux command parser """
+    if '\n' in arg:
+        raise ValueError(f"new line can't be passed to tmux control mode: {arg!r}")
+    return "'" + arg.replace("'", "'\\''") + "'"
+
+
+class TmuxControl:
+    """ tmux -C client attached to a session, commands are pipelined over its stdin """
+
+    def __init__(self, server, session_name):
+        self.session_name = session_name
+        self.tmux = tmux = ['tmux']
+        if server.socket_name:
+            tmux += ['-L', server.socket_name]
+        if server.socket_path:
+            tmux += ['-S', str(server.socket_path)]
+        if server.config_file:
+            tmux += ['-f', str(server.config_file)]
+        self.proc = subprocess.Popen(  # pylint: disable=consider-using-with
+            tmux + ['-C', 'attach-session', '-t', session_name],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        self.replies = queue.Queue()
+        self.calls = 0
+        self.round_trips = 0
+        self.reader = threading.Thread(target=self._read_replies, daemon=True)
+        self.reader.start()
+        # pane output is streamed via pipe-pane, control client does not need it
+        self.cmd('refresh-client', '-f', 'no-output')
+
+    def _read_replies(self):
+        """ reader thread, split control mode stream into command replies """
+        block = None
+        own = False
+        for raw in self.proc.stdout:
+            line = raw.decode('utf-8', errors='backslashreplace').rstrip('\n')
+            if block is None:
+                if line.startswith('%begin '):
+                    block = []
+                    own = int(line.split(' ')[3]) & FLAG_OWN_COMMAND
+                # anything else outside of block is a notification
+                continue
+            if line.startswith(('%end ', '%error ')) and len(line.split(' ')) == 4:
+                if own:
+                    self.replies.put(ControlResult(block, line.startswith('%error ')))
+                block = None
+                continue
+            block.append(line)
+        self.replies.put(None)
+
+    def _reply(self):
+        """ wait for next command reply """
+        result = self.replies.get()
+        if result is None:
+            self.replies.put(None)
+            raise ControlModeError("tmux control mode connection closed")
+        return result
+
+    def batch(self, commands):
+        """ send all commands in one write, return their replies in same order """
+        if not commands:
+            return []
+        data = ''.join(' '.join(quote(str(arg)) for arg in command) + '\n'
+                       for command in commands)
+        try:
+            self.proc.stdin.write(data.encode())
+            self.proc.stdin.flush()
+        except (BrokenPipeError, ValueError) as e:
+            raise ControlModeError("tmux control mode connection closed") from e
+        self.calls += len(commands)
+        self.round_trips += 1
+        return [self._reply() for _ in commands]
+
+    def cmd(self, *args):
+        """ run one tmux command """
+        return self.batch([args])[0]
+
+    def spawn(self, *args):
+        """ run one tmux command in its own client without waiting for it,
+            it is done by tmux server even after this process exits """
+        subprocess.Popen(  # pylint: disable=consider-using-with
+            self.tmux + [str(arg) for arg in args], stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True)
+
+    def close(self):
+        """ detach control client """
+        if self.proc.poll() is None:
+            try:
+                self.proc.stdin.close()
+            except BrokenPipeError:
+                pass
+            self.proc.wait()
@@ -1,79 +1,123 @@
 #!/usr/bin/env python3
 """ tmux_k8s - tool for executing command sequences on each pod within  separate tmux window """
 
-import time
 import sys
 import os
-import signal
-import libtmux
-from kubernetes import client, config
-from libtmux._internal.query_list import ObjectDoesNotExist
-from libtmux._internal.query_list import MultipleObjectsReturned
 
-
-from pod2container import pod2container as p2c
-from pod2container import pod2container_log as p2cLog
+from pod2container import load_rules, RuleError
 
 from sequences import sequences
-from seq_constants import COMMENT_TAG, NO_RETURN, FINAL_EXEC
-from seq_constants import DO_ATTACH, DO_TERMINATE, NO_T_EXEC_OP
-from seq_constants import DO_SLEEP, REFRESH_PROMPT
-
-SLEEP_TIME = 330
-WAIT_FOR_PROMPT_SECONDS = 1
-STEP_COMPLETE = -1
-BASE_WINDOW_NAME = 'base'
-
-
-def signal_handler_detach(sig, _):
-    """ set signal handler for ctr+c """
-    print(f'You pressed Ctrl+C! {sig}, exiting, leaving tmux windows')
-    sys.exit(9)
-
-
-def get_pods_list(k8s_context, k8s_namespace, k8s_label_selector, selector):
-    """ fetch pod list from given context,namespace, k8s_label_selector """
-    config.load_kube_config(context=k8s_context)
-
-    v1 = client.CoreV1Api()
-    k8s_ret = v1.list_namespaced_pod(
-        namespace=k8s_namespace, label_selector=k8s_label_selector,
-        field_selector=selector, watch=False)
-
-    pods_list = []
-    for item in k8s_ret.items:
-        pods_list.append(item.metadata.name)
-    return pods_list
-
-
-def get_fsm_prompt(pods_list, sess_handle, session_name):
-    """ tmux on start will get base prompt for given shell, catch that one """
-    print("---- waiting for prompt to stabilize")
-    time.sleep(WAIT_FOR_PROMPT_SECONDS)
-    print("---- getting prompt from live windows")
-    fsm_prompt = {}
-    for pod in pods_list:
-        try:
-            temp_window = sess_handle.windows.get(window_name=pod)
-        except MultipleObjectsReturned:
-            print(f"multiple objects returned for window {pod}, " +
-                  f"most probably old tmux session, try tmux kill-session -t {session_name}")
-            sys.exit(1)
-        temp_pane = temp_window.panes.get()
-        lines = temp_pane.cmd('capture-pane', '-p').stdout
-        print(f"prompt {pod} ->" + lines[-1])
-        fsm_prompt[pod] = lines[-1]
-    return fsm_prompt
+from seq_files import load_sequences, SEQUENCE_DIRS
+from seq_constants import COMMENT_TAG
+from seq_template import compile_sequence, TemplateError
+from seq_template import WAVE_ROLLING, WAVE_BATCH
+
+# --name=value cli options, name -> description
+OPTIONS = {
+    'max-in-flight': 'max number of pods running sequence at once, 0 is no limit',
+    'wave': f'{WAVE_ROLLING} starts pod as soon as one finishes, ' +
+            f'{WAVE_BATCH} waits for all in flight to finish',
+    'refresh': 'list pods from api server, do not use cached pod lists',
+    'watch': 'run sequence also on pods that start running meanwhile, ' +
+             'for at least given seconds, mark windows of pods that are gone',
+    'panes-per-window': 'pods per window, as tiled panes, 1 is window per pod',
+    'sync-panes': 'once sequence is done, keys typed go to all panes of window',
+    'save-scrollback': 'on terminate save whole scrollback of each pod to directory, ' +
+                       'default is run directory',
+    'log-panes': 'stream output of each pod pane to rotated logs in run directory, ' +
+                 'indexed by step, compressed with gzip (default), zstd or none',
+    'aggregate': 'group pods by identical output of each step, diff outliers against majority',
+}
+# options without value, or with optional one
+FLAGS = ('refresh', 'watch', 'sync-panes', 'save-scrollback', 'log-panes', 'aggregate')
 
 
 def simple_help(args):
     """ print simple help """
     p = args[0].split('/')[-1]
     print(f"{p} <sequence> <k8s-context> <k8s-namespace> [<k8s-label-selector>] [<pods_list>]")
+    print("  k8s-context and k8s-namespace can be comma separated lists of names or globs")
     print("or to list available sequences")
     print(f"{p} list")
     print("or to get details of a sequence")
     print(f"{p} info <sequence>")
+    print("options, placed anywhere, override sequence settings:")
+    for name, description in OPTIONS.items():
+        print(f"  --{name}{'[=<value>]' if name in FLAGS else '=<value>'} - {description}")
+
+
+def split_options(args):
+    """ separate --name=value options from positional args """
+    positional = []
+    options = {}
+    for arg in args:
+        if not arg.startswith('--'):
+            positional.append(arg)
+            continue
+        name, _, value = arg[2:].partition('=')
+        if name not in OPTIONS:
+            print(f"unknown option {arg}")
+            simple_help(args)
+            sys.exit(2)
+        options[name] = value
+    return positional, options
+
+
+def check_concurrency(sequence, options):
+    """ max pods in flight and wave mode, from cli or sequence settings """
+    max_in_flight = sequence.max_in_flight
+    if 'max-in-flight' in options:
+        try:
+            max_in_flight = int(options['max-in-flight'])
+        except ValueError:
+            max_in_flight = -1
+    if max_in_flight < 0:
+        print(f"--max-in-flight should be number of pods, got {options.get('max-in-flight')}")
+        sys.exit(2)
+    wave = options.get('wave', sequence.wave)
+    if wave not in (WAVE_ROLLING, WAVE_BATCH):
+        print(f"--wave should be {WAVE_ROLLING} or {WAVE_BATCH}, got {wave}")
+        sys.exit(2)
+    return max_in_flight, wave
+
+
+def check_watch(options):
+    """ seconds pod membership is watched for, None if it is not watched """
+    if 'watch' not in options:
+        return None
+    try:
+        seconds = int(options['watch'] or 0)
+    except ValueError:
+        seconds = -1
+    if seconds < 0:
+        print(f"--watch takes number of seconds, got {options['watch']}")
+        sys.exit(2)
+    return seconds
+
+
+def check_layout(options):
+    """ pods per window and whether panes of window get synchronized input """
+    try:
+        per_window = int(options.get('panes-per-window', 1))
+    except ValueError:
+        per_window = 0
+    if per_window < 1:
+        print(f"--panes-per-window should be number of pods, got {options['panes-per-window']}")
+        sys.exit(2)
+    return per_window, 'sync-panes' in options
+
+
+def check_pane_log(options):
+    """ compression of pane logs, None if panes are not logged """
+    if 'log-panes' not in options:
+        return None
+    compression = options['log-panes'] or 'gzip'
+    from pane_log import compression_error  # pylint: disable=import-outside-toplevel
+    error = compression_error(compression)
+    if error is not None:
+        print(f"--log-panes: {error}")
+        sys.exit(2)
+    return compression
 
 
 def check_2_args(seq, args):
@@ -90,22 +134,24 @@ def check_2_args(seq, args):
     sys.exit(1)
 
 
-def check_3_args(seq, args):
+def check_3_args(seq, args, origins):
     """ check 3 args """
     if args[1] == 'info' and args[2] in seq:
         for line in seq[args[2]]:
             print(line)
+        if args[2] in origins:
+            print(f"--- from {origins[args[2]]}")
     else:
         simple_help(args)
     sys.exit(0)
 
 
-def check_args(seq, args):
-    """ check cli args """
+def check_args(seq, args, origins=None):
+    """ check cli args, origins tells which sequences come from sequence files """
     if len(args) == 2:
         check_2_args(seq, args)
     if len(args) == 3:
-        check_3_args(seq, args)
+        check_3_args(seq, args, origins or {})
     if len(args) < 4:
         simple_help(args)
         sys.exit(2)
@@ -115,8 +161,8 @@ def check_args(seq, args):
     k8s_namespace = args[3]
 
     pods_filter = []
-    if len(sys.argv) == 5:
-        k8s_label_selector = sys.argv[4]
+    if len(args) == 5:
+        k8s_label_selector = args[4]
         if k8s_label_selector and len(k8s_label_selector.split('=')) == 1:
             pods_filter = k8s_label_selector.split(',')
             k8s_label_selector = ''
@@ -124,276 +170,67 @@ def check_args(seq, args):
         k8s_label_selector = ''
         pods_filter = []
 
-    if len(sys.argv) == 6:
-        k8s_label_selector = sys.argv[4]
-        pods_filter = sys.argv[5].split(',')
+    if len(args) == 6:
+        k8s_label_selector = args[4]
+        pods_filter = args[5].split(',')
 
     return tmux_cmd, k8s_context, k8s_namespace, k8s_label_selector, pods_filter
 
 
-def check_all_complete(state, pods_list):
-    """ check if state for all pods is complete """
-    all_complete = True
-    for pod in pods_list:
-        if state[pod] != STEP_COMPLETE:
-            all_complete = False
-    return all_complete
-
-
-def tmux_window_per_pod(sess_handle, pods_list):
-    """ creates new window per each pod in pods_list """
-    for pod in pods_list:
-        print(f"spawining window for {pod}")
-        sess_handle.new_window(attach=False, window_name=pod)
-
-
-def next_step(state, pod):
-    """ move finite state machine to next step """
-    state['fsm_step_executed'][pod] = False
-    state['fsm_step'][pod] += 1
-
-
-def initialize_state(pods_list):
-    """ create initial state per each pod """
-    state = {}
-    state['fsm_step'] = {}
-    state['fsm_step_executed'] = {}
-    for pod in pods_list:
-        state['fsm_step'][pod] = 0
-        state['fsm_step_executed'][pod] = False
-    return state
-
-
-def inform_base_window(pods_list, sess_handle, sequence, info, session_name):
-    """ print basic info of execution to base terminal window """
-    temp_window = sess_handle.windows.get(window_name=BASE_WINDOW_NAME)
-    temp_pane = temp_window.panes.get()
-    execute = "echo '=========================';"
-    execute += f"echo 'BASE WINDOW FOR SESSION {session_name}';"
-    execute += f"INFO: {info['context']} {info['namespace']} {info['label_selector']}"
-    execute += "echo ;"
-    execute += f"echo 'SEQUENCE {sequence}';"
-    execute += "echo 'pods:';"
-    for pod in pods_list:
-        execute += f"echo '   {pod} - '"
-        if p2c(pod) != pod:
-            execute += f"{p2c(pod)}"
-        if p2cLog(pod) != pod:
-            execute += f", {p2cLog(pod)}"
-        execute += ';'
-    execute += "echo ;"
-    execute += "echo 'ctrl+b + n for next pod terminal window';"
-    execute += "echo '=========================';"
-    temp_pane.send_keys(execute)
-
-
-def execute_fsm(pods_list, sess_handle, sequence, info, session_name):
-    """ execute finit state machine, sequence , step by step """
-    state = initialize_state(pods_list)
-
-    k8s_context = info['context']  # used within eval
-    k8s_namespace = info['namespace']  # used within eval
-
-    print(f"--- working with context {k8s_context} namespace {k8s_namespace}")
-    tmux_window_per_pod(sess_handle, pods_list)
-    state['fsm_prompt'] = get_fsm_prompt(pods_list, sess_handle, session_name)
-
-    while True:
-        for pod in pods_list:
-            if state['fsm_step'][pod] == STEP_COMPLETE:
-                continue
-            if state['fsm_step'][pod] >= len(sequence):
-                print(f"{pod} -> step complete")
-                state['fsm_step'][pod] = STEP_COMPLETE
-                continue
-            if sequence[state['fsm_step'][pod]].startswith(COMMENT_TAG):
-                print(f"---# COMMENT: {sequence[state['fsm_step'][pod]]}")
-                next_step(state, pod)
-                continue
-            if sequence[state['fsm_step'][pod]].startswith(REFRESH_PROMPT):
-                temp_window = sess_handle.windows.get(window_name=pod)
-                temp_pane = temp_window.panes.get()
-                lines = temp_pane.cmd('capture-pane', '-p').stdout
-                state['fsm_prompt'][pod] = lines[-1]
-                next_step(state, pod)
-                continue
-            if sequence[state['fsm_step'][pod]].startswith(DO_SLEEP):
-                to_sleep = int(sequence[state['fsm_step'][pod]][len(DO_SLEEP):])
-                print("executing -> " +  sequence[state['fsm_step'][pod]])
-                time.sleep(to_sleep)
-                next_step(state, pod)
-                continue
-            if sequence[state['fsm_step'][pod]].startswith(NO_T_EXEC_OP):
-                next_step(state, pod)
-                continue
-            if not state['fsm_step_executed'][pod]:
-                print(
-                    f"---- {info['cmd']} {pod} step " +
-                    f"{state['fsm_step'][pod]} {p2c(pod)} ----")
-                temp_window = sess_handle.windows.get(window_name=pod)
-                temp_pane = temp_window.panes.get()
-                execute = eval(f"f'{sequence[state['fsm_step'][pod]]}'")
-                print("executing -> " + execute)
-                temp_pane.send_keys(execute)
-                state['fsm_step_executed'][pod] = True
-                if len(sequence) - 1 > state['fsm_step'][pod] and \
-                        ( sequence[state['fsm_step'][pod] + 1].startswith(NO_RETURN) or \
-                        sequence[state['fsm_step'][pod] + 1].startswith(REFRESH_PROMPT) ):
-                    next_step(state, pod)
-                    continue
-            else:
-                # fsm step is executed,  waiting for prompt
-                temp_window = sess_handle.windows.get(window_name=pod)
-                temp_pane = temp_window.panes.get()
-                lines = temp_pane.cmd('capture-pane', '-p').stdout
-                if lines[-1].startswith(state['fsm_prompt'][pod]):
-                    next_step(state, pod)
-
-        if check_all_complete(state['fsm_step'], pods_list):
-            print("all complete")
-            break
-
-
-def new_tmux_session(tmux_server, session_name):
-    """ get new tmux session """
-    tmux_server.cmd('new-session', '-d', '-P', '-F#{session_id}', '-s', session_name)
-    sess_handle = tmux_server.sessions.get(session_name=session_name)
-    tmux_server.cmd('rename-window', '-t', f'{session_name}:{0}', BASE_WINDOW_NAME)
-    print(f"==== new session {session_name} created")
-    return sess_handle
-
-
-def check_session(session_name, tmux_server):
-    """ check if session already exist, and if it does exit """
-    tmux_session_exist = True
+def check_sequence(tmux_command, known):
+    """ check is input command available, compile it so malformed step fails upfront """
+    if tmux_command not in known:
+        print(f"{tmux_command} not in allowed commands, check sequences dictionary in " +
+              f"sequences.py or sequence files in {os.pathsep.join(SEQUENCE_DIRS)}")
+        sys.exit(1)
     try:
-        tmux_server.sessions.get(session_name=session_name)
-    except ObjectDoesNotExist:
-        tmux_session_exist = False
-
-    if tmux_session_exist:
-        print(f"tmux session {session_name} already exist try:")
-        print(f"terminating with: tmux kill-session -t {session_name}")
-        print(f"attach with: tmux attach-session -t {session_name}")
-        print("exiting")
-        sys.exit(5)
-
-
-def check_sequence(tmux_command):
-    """ check is input command available """
-    if tmux_command not in sequences:
-        print(f"{tmux_command} not in allowed commands, check sequences dictionary in sequences.py")
+        return compile_sequence(tmux_command, known[tmux_command])
+    except TemplateError as e:
+        print(f"sequence {tmux_command} is malformed: {e}")
         sys.exit(1)
 
 
-def waiting_message(session_name):
-    """ final message before waiting """
-    print(f"--- waiting {SLEEP_TIME} seconds before closing ---")
-    print(f"--- after {SLEEP_TIME} program will exit and leave all tmux_sessions ---")
-    print("--- ctr+c will exit and leave all tmux sessions ---")
-    print(f"--- \tattach with: tmux attach-session -t {session_name} ---")
-    print("---  or: ---")
-    print(f"--- \tremove with: tmux kill-session -t {session_name} ---")
-    print("--- ctr+\\ will exit and terminate all tmux sessions ---")
-
-
-def display_pods_and_containers(pods_list):
-    """ display selected pods and containers """
-    print("----- selected pods and containers -----")
-    for pod in pods_list:
-        print(f"pod: {pod}, container: {p2c(pod)}")
-    print("-----------")
-
-
-def terminate_tmux(tmux_server, tmux_handle):
-    """ terminate tmux handle windows and server """
+def check_rules():
+    """ load pod2container rules, so malformed rules file fails upfront """
     try:
-        for window in tmux_handle.windows:
-            temp_pane = window.panes.get()
-            lines = temp_pane.cmd('capture-pane', '-p').stdout
-            if len(lines) > 3:
-                print("->" + lines[-3] + " - " + lines[-2])
-            else:
-                print("->" + lines[0])
-            print("terminating", end="")
-            print(window)
-            window.kill()
-        tmux_server.kill()
-    except libtmux.exc.LibTmuxException as q:
-        print(q)
-
+        load_rules()
+    except RuleError as e:
+        print(f"pod2container rules: {e}")
+        sys.exit(1)
 
-def main():
-    """ main function, check args, get params for finite state machine """
 
+def main(argv=None):
+    """ main function, check args, get params for finite state machine,
+        argv is sys.argv unless called from kubectl plugin """
+    args, options = split_options(sys.argv if argv is None else argv)
+    known, origins = load_sequences(sequences)
     (tmux_cmd, k8s_context, k8s_namespace, k8s_label_selector,
-        pods_filter) = check_args(sequences, sys.argv)
-
-    check_sequence(tmux_cmd)
-    session_name = f'{tmux_cmd}-{k8s_context}-{k8s_namespace}'
-
-    pods_list = get_pods_list(
-        k8s_context, k8s_namespace,
-        k8s_label_selector, "status.phase=Running")
-    if pods_filter:
-        for item in pods_list.copy():
-            if item not in pods_filter:
-                pods_list.remove(item)
-    if pods_list:
-        display_pods_and_containers(pods_list)
-    else:
-        print("no pods selected, exiting")
-        sys.exit(6)
-
-    tmux_server = libtmux.Server()
-    check_session(session_name, tmux_server)
-    tmux_handle = new_tmux_session(tmux_server, session_name)
-
-    def terminate_all():
-        """ terminate session """
-        terminate_tmux(tmux_server, tmux_handle)
-
-    def signal_handler_terminate(sig, _):
-        """ set signal handler for ctr+c """
-        print(f'You pressed Ctrl+C! {sig}, terminating tmux windows')
-        terminate_all()
-        sys.exit(0)
-
-    signal.signal(signal.SIGINT, signal_handler_detach)
-    signal.signal(signal.SIGQUIT, signal.SIG_IGN)
-    print("--- ctr+c will exit and leave all tmux sessions," +
-          "sequence execution will be partially done ---")
-    print("--- ctr+\\ will be ignored  ---")
+        pods_filter) = check_args(known, args, origins)
+
+    sequence = check_sequence(tmux_cmd, known)
+    max_in_flight, wave = check_concurrency(sequence, options)
+    watch_seconds = check_watch(options)
+    per_window, sync_panes = check_layout(options)
+    pane_log = check_pane_log(options)
+    if 'aggregate' in options and not sequence.headless and not sequence.collects and \
+            pane_log is None:
+        print("--aggregate compares collected artifacts or pane logs, " +
+              "sequence does not collect, add --log-panes")
+        sys.exit(2)
+    check_rules()
+    # glob characters would be expanded by shell on attach
+    session_name = f'{tmux_cmd}-{k8s_context}-{k8s_namespace}'.translate(
+        str.maketrans('*?[]', '____'))
 
     info = {'cmd': tmux_cmd, 'context': k8s_context, 'namespace': k8s_namespace,
-            'label_selector': k8s_label_selector}
-    execute_fsm(pods_list, tmux_handle, sequences[tmux_cmd], info, session_name)
-    inform_base_window(pods_list, tmux_handle, tmux_cmd, info, session_name)
-
-    print("--- all executable sequence steps are executed ---")
-    signal.signal(signal.SIGQUIT, signal_handler_terminate)
-    if sequences[tmux_cmd][-1] == DO_ATTACH:
-        print("--- attaching tmux ---")
-        os.execve(
-            '/bin/sh',
-            ['/bin/sh', '-c', f'tmux attach-session -t {session_name}'],
-            os.environ)
-    elif sequences[tmux_cmd][-1].startswith(DO_TERMINATE):
-        terminate_all()
-    elif sequences[tmux_cmd][-1].startswith(FINAL_EXEC):
-        to_exec = sequences[tmux_cmd][-1][len(FINAL_EXEC):]
-        parsed_exec = eval(f'f"{to_exec}"')
-        print(f"--- final_exec: {parsed_exec}")
-        pid = os.fork()
-        if pid == 0:
-            os.system(parsed_exec)
-        else:
-            os.waitpid(pid, 0)
-        print("final exec complete, terminating sessions")
-        terminate_all()
-    else:
-        waiting_message(session_name)
-        time.sleep(SLEEP_TIME)
+            'label_selector': k8s_label_selector, 'pods_filter': pods_filter,
+            'max_in_flight': max_in_flight, 'wave': wave, 'watch': watch_seconds,
+            'per_window': per_window, 'sync_panes': sync_panes, 'log_compression': pane_log,
+            'session': session_name}
+    # kubernetes client, libtmux and all of execution take most of startup,
+    # list, info and malformed args do not need them
+    import fsm_run  # pylint: disable=import-outside-toplevel
+    fsm_run.run(sequence, info, options)
 
 
 if __name__ == '__main__':